@@ -64,10 +64,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'home.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -100,10 +102,86 @@ DATABASES = {
     'default': dj_database_url.config(
         default=config('DATABASE_URL'),
         conn_max_age=600,
-        ssl_require=True
+        ssl_require=config('DATABASE_SSL_REQUIRE', default=True, cast=bool)
     )
 }
 
+# SQLite (local development): take the write lock when a transaction
+# starts, so concurrent job workers wait for it instead of failing with
+# "database is locked" when a SELECT ... then UPDATE transaction upgrades.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+
+# Optional psycopg 3 connection pool (replaces persistent connections).
+# Bounds the number of server connections per process and health-checks
+# each connection before handing it out.
+if config('DATABASE_POOL', default=False, cast=bool):
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DATABASE_POOL_TIMEOUT', default=10, cast=float),
+        'max_idle': config('DATABASE_POOL_MAX_IDLE', default=300, cast=float),
+        'check': ConnectionPool.check_connection,
+    }
+
+# Server-side statement_timeout (ms) for heavy reporting views, see
+# home.db.statement_timeout.
+HEAVY_VIEW_STATEMENT_TIMEOUT_MS = config('HEAVY_VIEW_STATEMENT_TIMEOUT_MS', default=5000, cast=int)
+
+# Order archiving (python manage.py archive_orders): age in days after
+# which canceled / completed orders move out of the hot Order table.
+ORDER_ARCHIVE_CANCELED_DAYS = config('ORDER_ARCHIVE_CANCELED_DAYS', default=90, cast=int)
+ORDER_ARCHIVE_COMPLETED_DAYS = config('ORDER_ARCHIVE_COMPLETED_DAYS', default=730, cast=int)
+
+# Background jobs (python manage.py run_jobs --processes N)
+JOB_RETRY_BACKOFF_SECONDS = config('JOB_RETRY_BACKOFF_SECONDS', default=10, cast=int)
+JOB_LOCK_TIMEOUT_SECONDS = config('JOB_LOCK_TIMEOUT_SECONDS', default=600, cast=int)
+# Running jobs refresh their lock this often; keep it well under the timeout
+JOB_HEARTBEAT_SECONDS = config('JOB_HEARTBEAT_SECONDS', default=30, cast=float)
+# How long a fetched Etsy listing result is reused by the dashboard
+ETSY_LISTINGS_MAX_AGE_SECONDS = config('ETSY_LISTINGS_MAX_AGE_SECONDS', default=300, cast=int)
+
+# On-demand request profiling (superusers, ?_profile=1), see home/profiling.py
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILE_DIR = config('PROFILE_DIR', default=os.path.join(BASE_DIR, 'var', 'profiles'))
+PROFILE_SAMPLE_INTERVAL = config('PROFILE_SAMPLE_INTERVAL', default=0.001, cast=float)
+PROFILE_MAX_COUNT = config('PROFILE_MAX_COUNT', default=200, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use django.core.cache.backends.filebased.FileBasedCache with a shared
+# directory as CACHE_LOCATION when running more than one worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='etsy-default'),
+    }
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+# 'django.contrib.sessions.backends.cached_db' serves session reads from
+# the cache above and only falls back to django_session on a miss.
+
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
+
+
+# Authentication backends
+# ProfileModelBackend loads the user together with its Profile in a single
+# query. ModelBackend stays listed so sessions created before the switch
+# remain valid.
+
+AUTHENTICATION_BACKENDS = [
+    'home.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -161,6 +239,18 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),  # your project static folder
 ]
 
+# collectstatic writes content-hashed copies plus .gz/.br variants, and
+# WhiteNoise serves the best encoding the client accepts with
+# far-future immutable Cache-Control headers.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 
 
 # Security & SSL settings
@@ -183,9 +273,19 @@ CSRF_TRUSTED_ORIGINS = [
 ETSY_CLIENT_ID = config('ETSY_CLIENT_ID')
 ETSY_CLIENT_SECRET = config('ETSY_CLIENT_SECRET')
 ETSY_REDIRECT_URI = config('ETSY_REDIRECT_URI')
+ETSY_API_BASE = config('ETSY_API_BASE', default='https://api.etsy.com/v3')
+# Signing secret for Etsy webhooks ("whsec_..."); webhooks are rejected while unset
+ETSY_WEBHOOK_SECRET = config('ETSY_WEBHOOK_SECRET', default='')
 
 # Canva API credentials
 CANVA_CLIENT_ID = config('CANVA_CLIENT_ID')
 CANVA_CLIENT_SECRET = config('CANVA_CLIENT_SECRET')
 
 CANVA_REDIRECT_URI = config('CANVA_REDIRECT_URI')
+
+# Canva design thumbnails (see home/canva.py)
+CANVA_API_BASE = config('CANVA_API_BASE', default='https://api.canva.com/rest/v1')
+CANVA_THUMBNAIL_DIR = config('CANVA_THUMBNAIL_DIR', default=os.path.join(BASE_DIR, 'var', 'canva-thumbnails'))
+CANVA_THUMBNAIL_CACHE_MAX_BYTES = config('CANVA_THUMBNAIL_CACHE_MAX_BYTES', default=200 * 1024 * 1024, cast=int)
+CANVA_FETCH_WORKERS = config('CANVA_FETCH_WORKERS', default=8, cast=int)
+
@@ -1,7 +1,150 @@
+from collections import defaultdict
+
 from django.contrib import admin
-from .models import Order, Product, Profile
+from django.db import transaction
+from django.urls import reverse
+from django.utils.html import format_html_join
+from .models import ArchivedOrder, Job, Order, OrderRollup, Product, Profile, RequestProfile
+from .paginators import EstimatedCountPaginator
+
+
+# --------------------------
+# Products
+# --------------------------
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'price', 'cost', 'status', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('name',)
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+# --------------------------
+# Orders
+# --------------------------
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'user', 'quantity', 'total_price', 'status', 'created_at')
+    list_select_related = ('product', 'user')
+    list_filter = ('status',)
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    autocomplete_fields = ('product', 'user')
+    actions = ('mark_completed', 'mark_pending', 'mark_canceled')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def _set_status(self, request, queryset, status):
+        # One UPDATE for the whole selection; total_price is unaffected
+        # so Order.save() doesn't need to run, but units_sold moves by the
+        # quantity of each order that enters or leaves 'completed'.
+        with transaction.atomic():
+            Product.lock(set(queryset.values_list('product_id', flat=True)))
+            rows = list(
+                Order.objects.select_for_update().filter(pk__in=queryset.values('pk'))
+                .values_list('pk', 'product_id', 'status', 'quantity')
+            )
+            updated = Order.objects.filter(pk__in=[row[0] for row in rows]).update(status=status)
+            deltas = defaultdict(int)
+            for _, product_id, old_status, quantity in rows:
+                deltas[product_id] += Order.sold_units(status, quantity) - Order.sold_units(old_status, quantity)
+            Product.add_units_sold(deltas)
+        self.message_user(request, f"{updated} order(s) marked as {status}.")
+
+    @admin.action(description='Mark selected orders as completed')
+    def mark_completed(self, request, queryset):
+        self._set_status(request, queryset, 'completed')
+
+    @admin.action(description='Mark selected orders as pending')
+    def mark_pending(self, request, queryset):
+        self._set_status(request, queryset, 'pending')
+
+    @admin.action(description='Mark selected orders as canceled')
+    def mark_canceled(self, request, queryset):
+        self._set_status(request, queryset, 'canceled')
+
+
+# --------------------------
+# Profiles
+# --------------------------
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('user',)
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__email')
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+# --------------------------
+# Archive (read-only)
+# --------------------------
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'user', 'quantity', 'total_price', 'status', 'created_at', 'archived_at')
+    list_select_related = ('product', 'user')
+    list_filter = ('status',)
+    raw_id_fields = ('product', 'user')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OrderRollup)
+class OrderRollupAdmin(admin.ModelAdmin):
+    list_display = ('product', 'status', 'order_count', 'units', 'revenue')
+    list_select_related = ('product',)
+    list_filter = ('status',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# --------------------------
+# Background Jobs
+# --------------------------
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'priority', 'attempts', 'user', 'created_at', 'finished_at')
+    list_select_related = ('user',)
+    list_filter = ('status', 'name')
+    raw_id_fields = ('user',)
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+# --------------------------
+# Request Profiles
+# --------------------------
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'query_ms', 'user', 'files')
+    list_select_related = ('user',)
+    list_filter = ('method', 'status_code')
+    search_fields = ('path',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
-# Register your models here.
-admin.site.register(Order)
-admin.site.register(Product)
-admin.site.register(Profile)
\ No newline at end of file
+    @admin.display(description='Files')
+    def files(self, obj):
+        return format_html_join(' | ', '<a href="{}">{}</a>', (
+            (reverse('profile_download', args=[obj.pk, kind]), kind)
+            for kind in ('pstats', 'collapsed', 'sql')
+        ))
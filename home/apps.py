@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        # Register background job handlers with home.jobs
+        from . import tasks  # noqa: F401
+        # Register the FTS trigger database check
+        from . import search  # noqa: F401
@@ -0,0 +1,104 @@
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order, OrderRollup
+
+
+def archivable_orders(now=None):
+    """
+    Orders old enough to leave the hot table: canceled orders after
+    ORDER_ARCHIVE_CANCELED_DAYS and completed ones after
+    ORDER_ARCHIVE_COMPLETED_DAYS. Pending orders are never archived.
+    """
+    now = now or timezone.now()
+    canceled_before = now - datetime.timedelta(days=settings.ORDER_ARCHIVE_CANCELED_DAYS)
+    completed_before = now - datetime.timedelta(days=settings.ORDER_ARCHIVE_COMPLETED_DAYS)
+    return Order.objects.filter(
+        Q(status='canceled', created_at__lt=canceled_before)
+        | Q(status='completed', created_at__lt=completed_before)
+    )
+
+
+def archive_batch(batch_size=1000, now=None):
+    """
+    Move one batch of archivable orders into ArchivedOrder and fold them
+    into OrderRollup. Copy, rollup and delete share one transaction, so
+    an interrupted run leaves no half-archived batch and can simply be
+    restarted. Returns the number of orders archived.
+    """
+    with transaction.atomic():
+        batch = list(
+            archivable_orders(now)
+            .select_for_update(skip_locked=True)
+            .order_by('pk')[:batch_size]
+        )
+        if not batch:
+            return 0
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=o.pk,
+                product_id=o.product_id,
+                user_id=o.user_id,
+                quantity=o.quantity,
+                total_price=o.total_price,
+                status=o.status,
+                etsy_transaction_id=o.etsy_transaction_id,
+                created_at=o.created_at,
+            )
+            for o in batch
+        ])
+
+        deltas = defaultdict(lambda: [0, 0, 0])
+        for o in batch:
+            delta = deltas[(o.product_id, o.status)]
+            delta[0] += 1
+            delta[1] += o.quantity
+            delta[2] += o.total_price
+
+        for (product_id, status), (count, units, revenue) in deltas.items():
+            rollup, _ = OrderRollup.objects.get_or_create(product_id=product_id, status=status)
+            OrderRollup.objects.filter(pk=rollup.pk).update(
+                order_count=F('order_count') + count,
+                units=F('units') + units,
+                revenue=F('revenue') + revenue,
+            )
+
+        # Archived units move into the rollup, so units_sold is unchanged
+        Order.objects.filter(pk__in=[o.pk for o in batch]).delete()
+
+    return len(batch)
+
+
+def archive_orders(batch_size=1000, max_batches=None, now=None):
+    """
+    Archive in batches until nothing is left (or max_batches is hit).
+    Returns the total number of orders archived.
+    """
+    now = now or timezone.now()
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(batch_size=batch_size, now=now)
+        if not moved:
+            break
+        total += moved
+        batches += 1
+    return total
+
+
+def archived_totals(status=None):
+    """
+    Totals of archived orders from OrderRollup: order count, units and
+    revenue, optionally limited to one status.
+    """
+    rollups = OrderRollup.objects.all()
+    if status:
+        rollups = rollups.filter(status=status)
+    totals = rollups.aggregate(count=Sum('order_count'), units=Sum('units'), revenue=Sum('revenue'))
+    return {key: value or 0 for key, value in totals.items()}
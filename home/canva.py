@@ -0,0 +1,197 @@
+"""
+Canva design thumbnails.
+
+Design metadata and thumbnail images are fetched concurrently with a
+bounded thread pool and stored in a content-addressed on-disk cache:
+image bytes live under their SHA-256 digest, and a small index file maps
+each design id to its current digest. File mtimes serve as LRU clocks,
+and the cache is trimmed back under CANVA_THUMBNAIL_CACHE_MAX_BYTES
+after each fetch batch.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import connections
+
+from .tokens import TokenError, tokens
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+_thread_local = threading.local()
+
+
+# --------------------------
+# On-disk cache
+# --------------------------
+class ThumbnailCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or settings.CANVA_THUMBNAIL_DIR
+        self.max_bytes = max_bytes or settings.CANVA_THUMBNAIL_CACHE_MAX_BYTES
+        self.blob_dir = os.path.join(self.root, 'blobs')
+        self.index_dir = os.path.join(self.root, 'designs')
+
+    def blob_path(self, digest):
+        if not _DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid digest: {digest!r}")
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _index_path(self, design_id):
+        # Design ids are opaque strings; hash them into safe filenames
+        key = hashlib.sha256(design_id.encode()).hexdigest()
+        return os.path.join(self.index_dir, key)
+
+    def put(self, design_id, content):
+        """Store image bytes for a design and return their digest."""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            _atomic_write(path, content)
+        _atomic_write(self._index_path(design_id), digest.encode())
+        return digest
+
+    def digest_for(self, design_id):
+        """Digest of the cached thumbnail for a design, or None."""
+        try:
+            with open(self._index_path(design_id)) as f:
+                digest = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return digest if os.path.exists(self.blob_path(digest)) else None
+
+    def open(self, digest):
+        """Open a cached blob for reading and mark it recently used."""
+        path = self.blob_path(digest)
+        f = open(path, 'rb')
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def evict(self):
+        """
+        Delete least recently used blobs until the cache fits in
+        max_bytes. Returns the number of bytes freed.
+        """
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.blob_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+
+def image_content_type(f):
+    """Sniff PNG/JPEG/WebP from a file's first bytes (rewinds it)."""
+    head = f.read(12)
+    f.seek(0)
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def _atomic_write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# --------------------------
+# Fetching
+# --------------------------
+def _session():
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = _thread_local.session = requests.Session()
+    return session
+
+
+def fetch_design(user, design_id):
+    """Fetch metadata for one design from the Canva Connect API."""
+    response = tokens.request(
+        user, 'canva', 'GET',
+        f"{settings.CANVA_API_BASE}/designs/{design_id}",
+        session=_session(),
+        timeout=15,
+    )
+    response.raise_for_status()
+    return response.json()['design']
+
+
+def _fetch_one(user, design_id, cache):
+    try:
+        design = fetch_design(user, design_id)
+        thumbnail_url = (design.get('thumbnail') or {}).get('url')
+        if not thumbnail_url:
+            return None
+        response = _session().get(thumbnail_url, timeout=15)
+        response.raise_for_status()
+        return cache.put(design_id, response.content)
+    finally:
+        # A token refresh may have opened a DB connection in this thread
+        connections.close_all()
+
+
+def fetch_thumbnails(user, design_ids, cache=None, max_workers=None):
+    """
+    Fetch metadata and thumbnails for many designs concurrently and store
+    them in the cache. Returns {design_id: digest or None}; a failed
+    design maps to None without aborting the rest of the batch.
+    """
+    cache = cache or ThumbnailCache()
+    design_ids = list(dict.fromkeys(design_ids))
+    results = {}
+    if not design_ids:
+        return results
+
+    # Load the token here so pool threads normally hit the memory cache
+    tokens.get_access_token(user, 'canva')
+    max_workers = min(max_workers or settings.CANVA_FETCH_WORKERS, len(design_ids))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            design_id: pool.submit(_fetch_one, user, design_id, cache)
+            for design_id in design_ids
+        }
+        for design_id, future in futures.items():
+            try:
+                results[design_id] = future.result()
+            except (requests.RequestException, TokenError, KeyError, ValueError) as e:
+                logger.warning("Canva thumbnail fetch failed for %s: %s", design_id, e)
+                results[design_id] = None
+
+    cache.evict()
+    return results
@@ -0,0 +1,59 @@
+import functools
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.http import HttpResponse
+
+# Postgres SQLSTATE raised when statement_timeout cancels a query.
+QUERY_CANCELED = '57014'
+
+
+def pool_stats(using='default'):
+    """
+    Return psycopg pool counters (connections in use, requests waiting,
+    total wait time, ...) for this process, or None when pooling is off.
+    """
+    connection = connections[using]
+    pool = getattr(connection, 'pool', None)
+    if pool is None:
+        return None
+    return pool.get_stats()
+
+
+def statement_timeout(timeout_ms=None, using='default'):
+    """
+    Run a view inside a transaction with a server-side statement_timeout.
+
+    The setting is transaction-local (SET LOCAL), so it never
+    leaks into the next request that reuses the (pooled) connection.
+    A cancelled query returns a 503 instead of holding the connection.
+    Databases other than Postgres run the view unchanged.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            connection = connections[using]
+            if connection.vendor != 'postgresql':
+                return view_func(request, *args, **kwargs)
+
+            timeout = timeout_ms or settings.HEAVY_VIEW_STATEMENT_TIMEOUT_MS
+            try:
+                with transaction.atomic(using=using):
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT set_config('statement_timeout', %s, true)",
+                            [str(int(timeout))],
+                        )
+                    return view_func(request, *args, **kwargs)
+            except OperationalError as e:
+                # psycopg exposes .sqlstate, psycopg2 exposes .pgcode
+                cause = e.__cause__
+                code = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+                if code != QUERY_CANCELED:
+                    raise
+                return HttpResponse(
+                    'This report took too long to build. Please try again shortly.',
+                    status=503,
+                )
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,176 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# name -> callable(payload) returning a JSON-serialisable result
+TASKS = {}
+
+
+def task(name):
+    """
+    Register a function as a job handler under `name`.
+    """
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, priority=0, max_attempts=3, user=None, run_at=None):
+    """
+    Queue a job and return it immediately; a worker picks it up later.
+    """
+    if name not in TASKS:
+        raise ValueError(f"Unknown job: {name}")
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        max_attempts=max_attempts,
+        user=user,
+        run_at=run_at or timezone.now(),
+    )
+
+
+def claim_job(worker_id):
+    """
+    Lock the next runnable job for this worker, highest priority first.
+    SKIP LOCKED lets concurrent workers claim different rows without
+    waiting on each other; the row lock only lives for this short
+    transaction, the job itself runs outside it.
+    """
+    with transaction.atomic():
+        job = (
+            Job.objects.filter(status='queued', run_at__lte=timezone.now())
+            .select_for_update(skip_locked=True)
+            .order_by('-priority', 'run_at', 'pk')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.locked_by = worker_id
+        job.locked_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'locked_by', 'locked_at', 'attempts'])
+    return job
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2x base, 4x base, ..."""
+    return datetime.timedelta(seconds=settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Refresh locked_at every JOB_HEARTBEAT_SECONDS while a job runs, so a
+    long but healthy job is never mistaken for one whose worker died.
+    """
+
+    def __init__(self, job):
+        super().__init__(name=f"job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_HEARTBEAT_SECONDS):
+                Job.objects.filter(pk=self.job.pk, status='running', locked_by=self.job.locked_by) \
+                    .update(locked_at=timezone.now())
+        except Exception:
+            logger.exception("Heartbeat for job %s failed", self.job.pk)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """
+    Execute a claimed job and record the outcome. Failures are retried
+    with backoff until max_attempts, then the job is marked failed.
+    """
+    heartbeat = _Heartbeat(job)
+    heartbeat.start()
+    try:
+        func = TASKS[job.name]
+        job.result = func(job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+        logger.warning("Job %s failed (attempt %s/%s)", job.pk, job.attempts, job.max_attempts)
+    else:
+        job.status = 'succeeded'
+        job.finished_at = timezone.now()
+    finally:
+        heartbeat.stop()
+
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['result', 'last_error', 'status', 'run_at', 'finished_at', 'locked_by', 'locked_at'])
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Recover jobs whose worker died mid-run, i.e. whose heartbeat stopped
+    more than JOB_LOCK_TIMEOUT_SECONDS ago. They are requeued, unless they
+    have used all their attempts (a job that keeps killing its worker),
+    in which case they are marked failed. Returns how many were recovered.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status='running', locked_at__lt=now - datetime.timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS),
+    )
+    # Two single-statement updates; exhausted jobs are failed first so the
+    # second only sees the ones that may still be retried
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', locked_at=None, finished_at=now,
+        last_error='Worker stopped responding during the final attempt',
+    )
+    requeued = stale.update(status='queued', locked_by='', locked_at=None, run_at=now)
+    return failed + requeued
+
+
+def work(worker_id=None, poll_interval=1.0, burst=False):
+    """
+    Worker loop: claim and run jobs until interrupted. With burst=True
+    return as soon as the queue is empty. Returns the number of jobs run.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    next_sweep = 0
+    while True:
+        close_old_connections()
+        # Sweep for dead workers' jobs on a timer, not only when idle
+        if time.monotonic() >= next_sweep:
+            requeue_stale_jobs()
+            next_sweep = time.monotonic() + settings.JOB_HEARTBEAT_SECONDS
+        job = claim_job(worker_id)
+        if job is None:
+            if burst:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
@@ -0,0 +1,335 @@
+"""
+Concurrent load-testing harness.
+
+Pieces used by `manage.py loadtest`:
+- an Etsy API stub with configurable latency and error rate
+- a dependency-free asyncio HTTP/1.1 client with keep-alive
+- a mixed read/write scenario. Staff page views on dashboard, orders,
+  products and revenue run alongside signed Etsy webhook order
+  deliveries.
+- latency/throughput/error summaries per concurrency level
+
+Everything the scenario writes is marked so cleanup_load_data() can
+remove it: webhook orders use negative Etsy listing, transaction and
+buyer ids, and event ids start with "load-".
+"""
+import asyncio
+import json
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .models import ArchivedOrder, Job, Order, Product, WebhookEvent
+from .webhooks import sign_payload
+
+READ_PATHS = ['/dashboard/', '/orders/', '/products/', '/revenue/']
+WEBHOOK_PATH = '/etsy/webhook/'
+LOADTEST_USERNAME = 'loadtest'
+EVENT_PREFIX = 'load-'
+
+
+# --------------------------
+# Etsy API stub
+# --------------------------
+class EtsyStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if not self._delay_or_fail():
+            return
+        if self.path.startswith('/application/shops/') and self.path.rstrip('/').endswith('/listings'):
+            results = [
+                {'listing_id': i, 'title': f"Stub listing {i}", 'price': {'amount': 999, 'divisor': 100}}
+                for i in range(1, 26)
+            ]
+            return self._json(200, {'count': len(results), 'results': results})
+        self._json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self._delay_or_fail():
+            return
+        if self.path == '/public/oauth/token':
+            return self._json(200, {
+                'access_token': f"stub-{uuid.uuid4().hex}",
+                'refresh_token': f"stub-refresh-{uuid.uuid4().hex}",
+                'expires_in': 3600,
+            })
+        self._json(404, {'error': 'not found'})
+
+    def _delay_or_fail(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self._json(503, {'error': 'stub failure'})
+            return False
+        return True
+
+    def _json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_etsy_stub(latency=0.0, error_rate=0.0, host='127.0.0.1', port=0):
+    """
+    Serve the stub in a daemon thread. Returns (server, base_url); point
+    ETSY_API_BASE at base_url and call server.shutdown() when done.
+    """
+    server = ThreadingHTTPServer((host, port), EtsyStubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# --------------------------
+# Asyncio HTTP client
+# --------------------------
+class HttpConnection:
+    """One keep-alive HTTP/1.1 connection (one per virtual user)."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed by server')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in response_headers:
+            await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            await self.reader.read()
+            await self.close()
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+
+# --------------------------
+# Scenario
+# --------------------------
+def _webhook_request(secret):
+    # Negative ids never collide with real Etsy data (see cleanup_load_data)
+    body = json.dumps({'event_type': 'order.paid', 'data': {
+        'transaction_id': -random.randint(1, 10 ** 12),
+        'listing_id': -random.randint(1, 200),
+        'quantity': random.randint(1, 3),
+        'price': '9.99',
+        'buyer_user_id': -random.randint(1, 5000),
+    }}).encode()
+    event_id = f"{EVENT_PREFIX}{uuid.uuid4().hex}"
+    timestamp = str(int(time.time()))
+    return body, {
+        'Content-Type': 'application/json',
+        'webhook-id': event_id,
+        'webhook-timestamp': timestamp,
+        'webhook-signature': sign_payload(event_id, timestamp, body, secret),
+    }
+
+
+async def _virtual_user(host, port, deadline, write_ratio, cookie, secret, results):
+    conn = HttpConnection(host, port)
+    # SECURE_SSL_REDIRECT is on; present as if behind the TLS proxy
+    base_headers = {'X-Forwarded-Proto': 'https'}
+    try:
+        while time.perf_counter() < deadline:
+            if random.random() < write_ratio:
+                kind, method, path = 'write', 'POST', WEBHOOK_PATH
+                body, headers = _webhook_request(secret)
+            else:
+                kind, method, path = 'read', 'GET', random.choice(READ_PATHS)
+                body, headers = b'', {'Cookie': cookie}
+            start = time.perf_counter()
+            try:
+                status = await conn.request(method, path, {**base_headers, **headers}, body)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                status = None
+                await conn.close()
+            results.append((kind, status, time.perf_counter() - start))
+    finally:
+        await conn.close()
+
+
+async def run_level(host, port, concurrency, duration, write_ratio, cookie, secret):
+    """Drive `concurrency` virtual users for `duration` seconds."""
+    results = []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        _virtual_user(host, port, deadline, write_ratio, cookie, secret, results)
+        for _ in range(concurrency)
+    ])
+    return summarize(results, time.perf_counter() - started)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def summarize(results, elapsed):
+    """
+    Throughput, latency percentiles (ms) and error rate, overall and per
+    kind. Anything but a 2xx counts as an error: a redirect to the login
+    page means the staff session was lost.
+    """
+    def stats(rows):
+        latencies = sorted(r[2] * 1000 for r in rows)
+        errors = sum(1 for r in rows if r[1] is None or not 200 <= r[1] < 300)
+        return {
+            'requests': len(rows),
+            'rps': round(len(rows) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(statistics.median(latencies), 1) if latencies else 0.0,
+            'p95_ms': round(_percentile(latencies, 95), 1),
+            'p99_ms': round(_percentile(latencies, 99), 1),
+            'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+        }
+
+    return {
+        'all': stats(results),
+        'read': stats([r for r in results if r[0] == 'read']),
+        'write': stats([r for r in results if r[0] == 'write']),
+    }
+
+
+# --------------------------
+# Process management
+# --------------------------
+def free_port(host='127.0.0.1'):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def server_command(kind, host, port, workers):
+    """
+    Command line for serving the project under WSGI (gunicorn) or ASGI
+    (uvicorn). Both are optional tools, imported only to check they exist.
+    """
+    if kind == 'wsgi':
+        __import__('gunicorn')
+        return [sys.executable, '-m', 'gunicorn', 'etsy.wsgi:application',
+                '--bind', f"{host}:{port}", '--workers', str(workers), '--threads', '4']
+    if kind == 'asgi':
+        __import__('uvicorn')
+        return [sys.executable, '-m', 'uvicorn', 'etsy.asgi:application',
+                '--host', host, '--port', str(port), '--workers', str(workers), '--no-access-log']
+    raise ValueError(f"Unknown server kind: {kind}")
+
+
+def start_process(cmd, env, cwd):
+    """
+    Start a server or consumer with its output in an anonymous temp file
+    (proc.log). A pipe nobody reads would fill up and block the process
+    mid-run, skewing the numbers.
+    """
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+    proc.log = log
+    return proc
+
+
+def stop_process(proc):
+    proc.terminate()
+    proc.wait()
+    proc.log.close()
+
+
+def log_tail(proc, limit=2000):
+    proc.log.seek(0)
+    return proc.log.read().decode(errors='replace')[-limit:]
+
+
+# --------------------------
+# Data
+# --------------------------
+def cleanup_load_data(session_keys=()):
+    """
+    Remove what a load test wrote: webhook orders, placeholder products
+    and buyers (negative Etsy ids), webhook events, the given sessions,
+    and the staff user with its jobs and token. Safe to re-run after an
+    interrupted test. Returns the number of rows deleted.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    for key in session_keys:
+        store(key).delete()
+
+    deleted = 0
+    for qs in [
+        WebhookEvent.objects.filter(event_id__startswith=EVENT_PREFIX),
+        Order.objects.filter(etsy_transaction_id__lt=0),
+        ArchivedOrder.objects.filter(etsy_transaction_id__lt=0),
+        Product.objects.filter(etsy_listing_id__lt=0),
+        User.objects.filter(username__startswith='etsy--', is_active=False),
+        Job.objects.filter(user__username=LOADTEST_USERNAME),
+        # Only the account this tool made: it never has a usable password
+        User.objects.filter(username=LOADTEST_USERNAME, password__startswith='!'),
+    ]:
+        deleted += qs.delete()[0]
+    return deleted
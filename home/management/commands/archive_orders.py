@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from home.archive import archivable_orders, archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move old canceled/completed orders out of the hot Order table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop after this many batches; rerun to resume.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many orders would be archived.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{archivable_orders().count()} order(s) eligible for archiving.")
+            return
+
+        archived = archive_orders(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} order(s)."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from home.webhooks import drain_events
+
+
+class Command(BaseCommand):
+    help = "Apply queued Etsy webhook events to orders and products in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the log is empty.")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once the log is empty.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            # Long-running consumer: drop connections the server has closed
+            close_old_connections()
+            total += drain_events(batch_size=options['batch_size'])
+            if options['burst']:
+                break
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS(f"Consumed {total} event(s)."))
@@ -0,0 +1,177 @@
+import asyncio
+import datetime
+import json
+import os
+import secrets
+import sys
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from home.loadtest import (
+    LOADTEST_USERNAME, cleanup_load_data, free_port, log_tail, run_level, server_command,
+    start_etsy_stub, start_process, stop_process, wait_for_port,
+)
+from home.models import OAuthToken, Profile
+
+HOST = '127.0.0.1'
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the app under WSGI and/or ASGI against a local Etsy stub, drive "
+        "mixed staff reads and webhook writes at each concurrency level, and "
+        "report throughput, latency percentiles and error rates. Writes test "
+        "data to the configured database (removed afterwards), so it must be "
+        "confirmed with --write-to-database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=2,
+                            help="Server worker processes.")
+        parser.add_argument('--concurrency', default='1,8,32,64',
+                            help="Comma-separated virtual user counts, one run each.")
+        parser.add_argument('--duration', type=float, default=15.0,
+                            help="Seconds per concurrency level.")
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help="Share of requests that are webhook order deliveries.")
+        parser.add_argument('--etsy-latency', type=float, default=0.1,
+                            help="Seconds the Etsy stub waits before answering.")
+        parser.add_argument('--etsy-error-rate', type=float, default=0.05,
+                            help="Share of Etsy stub responses that are 503s.")
+        parser.add_argument('--no-consumers', action='store_true',
+                            help="Don't run the job and webhook drain workers alongside.")
+        parser.add_argument('--json', dest='json_path', default=None,
+                            help="Also write the results to this file.")
+        parser.add_argument('--write-to-database', action='store_true',
+                            help="Confirm that test orders, users and a session may be written "
+                                 "to the configured database. Never point this at production.")
+        parser.add_argument('--keep-data', action='store_true',
+                            help="Leave the test data in place for inspection.")
+        parser.add_argument('--cleanup-only', action='store_true',
+                            help="Only remove data left by an interrupted run.")
+
+    def handle(self, *args, **options):
+        if not options['write_to_database']:
+            db = connection.settings_dict
+            raise CommandError(
+                f"loadtest writes orders, users and a session to {db['ENGINE'].rsplit('.', 1)[-1]} "
+                f"database '{db['NAME']}'{' on ' + db['HOST'] if db.get('HOST') else ''}. "
+                "Re-run with --write-to-database against a disposable database."
+            )
+        if options['cleanup_only']:
+            self.stdout.write(f"Removed {cleanup_load_data()} row(s).")
+            return
+
+        try:
+            levels = [int(n) for n in options['concurrency'].split(',') if n.strip()]
+        except ValueError:
+            raise CommandError("--concurrency must be comma-separated integers.")
+        if not levels or min(levels) < 1:
+            raise CommandError("--concurrency must be positive.")
+        kinds = ['wsgi', 'asgi'] if options['server'] == 'both' else [options['server']]
+
+        stub, stub_url = start_etsy_stub(options['etsy_latency'], options['etsy_error_rate'], HOST)
+        webhook_secret = settings.ETSY_WEBHOOK_SECRET or f"loadtest-{secrets.token_hex(16)}"
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'etsy.settings'),
+            'ETSY_API_BASE': stub_url,
+            'ETSY_WEBHOOK_SECRET': webhook_secret,
+        }
+        session_key = self._staff_session()
+        cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}"
+        cwd = str(settings.BASE_DIR)
+
+        consumers = []
+        if not options['no_consumers']:
+            manage = [sys.executable, 'manage.py']
+            consumers = [
+                start_process(manage + ['run_jobs', '--poll-interval', '0.2'], env, cwd),
+                start_process(manage + ['drain_webhooks', '--poll-interval', '0.2'], env, cwd),
+            ]
+
+        results = []
+        try:
+            for kind in kinds:
+                results += self._run_server(kind, levels, options, env, cwd, cookie, webhook_secret)
+        finally:
+            for proc in consumers:
+                stop_process(proc)
+            stub.shutdown()
+            if options['keep_data']:
+                self.stdout.write("Test data kept; remove it with --cleanup-only.")
+            else:
+                self.stdout.write(f"Removed {cleanup_load_data([session_key])} row(s) of test data.")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def _run_server(self, kind, levels, options, env, cwd, cookie, webhook_secret):
+        port = free_port(HOST)
+        try:
+            cmd = server_command(kind, HOST, port, options['workers'])
+        except ImportError as e:
+            raise CommandError(f"{kind.upper()} run needs '{e.name}' installed (pip install {e.name}).")
+
+        proc = start_process(cmd, env, cwd)
+        try:
+            if not wait_for_port(HOST, port):
+                raise CommandError(f"{kind.upper()} server did not start: {log_tail(proc)}")
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{kind.upper()} ({options['workers']} workers) on {HOST}:{port}"
+            ))
+            self.stdout.write(f"{'users':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+                              f" {'read p99':>9} {'write p99':>10}")
+            results = []
+            for concurrency in levels:
+                summary = asyncio.run(run_level(
+                    HOST, port, concurrency, options['duration'], options['write_ratio'],
+                    cookie, webhook_secret,
+                ))
+                overall = summary['all']
+                self.stdout.write(
+                    f"{concurrency:>6} {overall['rps']:>8} {overall['p50_ms']:>8} {overall['p95_ms']:>8}"
+                    f" {overall['p99_ms']:>8} {overall['error_rate']:>7.1%}"
+                    f" {summary['read']['p99_ms']:>9} {summary['write']['p99_ms']:>10}"
+                )
+                results.append({'server': kind, 'workers': options['workers'],
+                                'concurrency': concurrency, **summary})
+            return results
+        finally:
+            stop_process(proc)
+
+    def _staff_session(self):
+        """
+        Session key for a superuser with a connected (stubbed) Etsy
+        account, so the dashboard exercises the listings job.
+        """
+        user, created = User.objects.get_or_create(
+            username=LOADTEST_USERNAME, defaults={'is_staff': True, 'is_superuser': True},
+        )
+        if created:
+            user.set_unusable_password()
+            user.save()
+        elif user.has_usable_password():
+            raise CommandError(f"A real '{LOADTEST_USERNAME}' account exists; refusing to reuse it.")
+        Profile.objects.get_or_create(user=user)
+        OAuthToken.objects.update_or_create(user=user, provider='etsy', defaults={
+            'access_token': 'loadtest',
+            'refresh_token': 'loadtest',
+            'expires_at': timezone.now() + datetime.timedelta(days=365),
+        })
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
@@ -0,0 +1,82 @@
+import json
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from home.webhooks import sign_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay recorded Etsy webhook payloads (one JSON object per line) "
+        "against a running server and report throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="JSONL file of recorded payloads.")
+        parser.add_argument('--url', default='http://127.0.0.1:8000/etsy/webhook/')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=1,
+                            help="Send the recording this many times (fresh event ids each time).")
+        parser.add_argument('--secret', default=None,
+                            help="Signing secret (defaults to ETSY_WEBHOOK_SECRET).")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file']) as f:
+                payloads = [line.strip() for line in f if line.strip()]
+        except OSError as e:
+            raise CommandError(e)
+        if not payloads:
+            raise CommandError("No payloads in file.")
+
+        bodies = [
+            body.encode()
+            for _ in range(options['repeat'])
+            for body in payloads
+        ]
+        local = threading.local()
+
+        def send(body):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            event_id = f"replay-{uuid.uuid4().hex}"
+            timestamp = str(int(time.time()))
+            headers = {
+                'Content-Type': 'application/json',
+                'webhook-id': event_id,
+                'webhook-timestamp': timestamp,
+                'webhook-signature': sign_payload(event_id, timestamp, body, options['secret']),
+                # SECURE_SSL_REDIRECT is on; pretend we came through the TLS proxy
+                'X-Forwarded-Proto': 'https',
+            }
+            start = time.perf_counter()
+            try:
+                status = session.post(options['url'], data=body, headers=headers, timeout=30).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            return status, time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(send, bodies))
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(status for status, _ in results)
+        latencies = sorted(latency * 1000 for _, latency in results)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(json.dumps({
+            'events': len(results),
+            'seconds': round(elapsed, 3),
+            'events_per_second': round(len(results) / elapsed, 1),
+            'latency_ms_p50': round(statistics.median(latencies), 2),
+            'latency_ms_p99': round(p99, 2),
+            'statuses': {str(k): v for k, v in statuses.items()},
+        }, indent=2))
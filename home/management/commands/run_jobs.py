@@ -0,0 +1,56 @@
+import multiprocessing
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker(poll_interval, burst):
+    # Under spawn/forkserver the child starts from a fresh interpreter, so
+    # set Django up before importing anything that touches models (a no-op
+    # after fork). Each process opens its own DB connection on first use.
+    django.setup()
+    from home.jobs import work
+
+    work(poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (one per process)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+
+        if processes == 1:
+            from home.jobs import work
+
+            processed = work(poll_interval=poll_interval, burst=burst)
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
+            return
+
+        # Connections must not be shared across fork()
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=_worker, args=(poll_interval, burst))
+            for _ in range(processes)
+        ]
+        for p in workers:
+            p.start()
+        try:
+            for p in workers:
+                p.join()
+        except KeyboardInterrupt:
+            for p in workers:
+                p.terminate()
+            for p in workers:
+                p.join()
+        self.stdout.write(self.style.SUCCESS(f"{processes} worker(s) stopped."))
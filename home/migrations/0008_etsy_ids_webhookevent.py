@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='etsy_transaction_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='etsy_transaction_id',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='etsy_listing_id',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(db_index=True, max_length=100)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='home_webhoo_process_fea6ce_idx')],
+            },
+        ),
+    ]
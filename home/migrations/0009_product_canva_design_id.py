@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_etsy_ids_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='canva_design_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_profile_tokens(apps, schema_editor):
+    """Move access tokens saved on Profile into OAuthToken (expiry unknown)."""
+    Profile = apps.get_model('home', 'Profile')
+    OAuthToken = apps.get_model('home', 'OAuthToken')
+    tokens = []
+    for profile in Profile.objects.all():
+        for provider in ('etsy', 'canva'):
+            access_token = getattr(profile, f'{provider}_access_token')
+            if access_token:
+                tokens.append(OAuthToken(user_id=profile.user_id, provider=provider, access_token=access_token))
+    OAuthToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0009_product_canva_design_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OAuthToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('etsy', 'Etsy'), ('canva', 'Canva')], max_length=10)),
+                ('access_token', models.TextField()),
+                ('refresh_token', models.TextField(blank=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('scope', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='oauth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'provider'), name='unique_oauth_token_user_provider')],
+            },
+        ),
+        migrations.RunPython(copy_profile_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='profile',
+            name='canva_access_token',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='etsy_access_token',
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:47
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+# Postgres: trigram GIN index matching Django's icontains lookup,
+# UPPER("name") LIKE UPPER('%q%').
+PG_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS home_product_name_trgm_idx "
+    "ON home_product USING gin (UPPER(name) gin_trgm_ops)",
+]
+PG_DROP = ["DROP INDEX IF EXISTS home_product_name_trgm_idx"]
+
+# SQLite: external-content FTS5 table kept in sync by triggers. Note that
+# SQLite table rebuilds in later AlterField migrations drop the triggers;
+# recreate them there if home_product is ever remade.
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS home_product_fts "
+    "USING fts5(name, content='home_product', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS home_product_fts_ai AFTER INSERT ON home_product BEGIN "
+    "INSERT INTO home_product_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS home_product_fts_ad AFTER DELETE ON home_product BEGIN "
+    "INSERT INTO home_product_fts(home_product_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS home_product_fts_au AFTER UPDATE OF name ON home_product BEGIN "
+    "INSERT INTO home_product_fts(home_product_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO home_product_fts(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO home_product_fts(home_product_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS home_product_fts_ai",
+    "DROP TRIGGER IF EXISTS home_product_fts_ad",
+    "DROP TRIGGER IF EXISTS home_product_fts_au",
+    "DROP TABLE IF EXISTS home_product_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_oauthtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='home_produc_price_f458ca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('price'), '-', models.F('cost')), name='home_product_profit_idx'),
+        ),
+        migrations.RunPython(
+            _run({'postgresql': PG_CREATE, 'sqlite': SQLITE_CREATE}),
+            _run({'postgresql': PG_DROP, 'sqlite': SQLITE_DROP}),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:02
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+# AddField rebuilds home_product on SQLite, which drops the FTS5 sync
+# triggers from 0011_product_search; recreate them and resync the index.
+SQLITE_FTS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS home_product_fts_ai AFTER INSERT ON home_product BEGIN "
+    "INSERT INTO home_product_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS home_product_fts_ad AFTER DELETE ON home_product BEGIN "
+    "INSERT INTO home_product_fts(home_product_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS home_product_fts_au AFTER UPDATE OF name ON home_product BEGIN "
+    "INSERT INTO home_product_fts(home_product_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO home_product_fts(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO home_product_fts(home_product_fts) VALUES ('rebuild')",
+]
+
+
+def recreate_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_FTS_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def backfill_units_sold(apps, schema_editor):
+    Product = apps.get_model('home', 'Product')
+    Order = apps.get_model('home', 'Order')
+    OrderRollup = apps.get_model('home', 'OrderRollup')
+    hot = (
+        Order.objects.filter(product=models.OuterRef('pk'), status='completed')
+        .values('product').annotate(total=models.Sum('quantity')).values('total')
+    )
+    archived = OrderRollup.objects.filter(product=models.OuterRef('pk'), status='completed').values('units')
+    Product.objects.update(units_sold=(
+        Coalesce(models.Subquery(hot, output_field=models.BigIntegerField()), 0)
+        + Coalesce(models.Subquery(archived, output_field=models.BigIntegerField()), 0)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-units_sold', '-id'], name='home_produc_units_s_6ff397_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-units_sold', '-id'], name='home_produc_status_889afe_idx'),
+        ),
+        migrations.RunPython(recreate_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_units_sold, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # --------------------------
 # Digital Product
@@ -14,29 +17,83 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2)
     cost = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    etsy_listing_id = models.BigIntegerField(unique=True, null=True, blank=True)
+    canva_design_id = models.CharField(max_length=64, blank=True)
+    # Completed units incl. archived orders; kept by add_units_sold() deltas
+    units_sold = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['-created_at']),
+            models.Index(fields=['price']),
+            models.Index(models.F('price') - models.F('cost'), name='home_product_profit_idx'),
+            models.Index(fields=['-units_sold', '-id']),
+            models.Index(fields=['status', '-units_sold', '-id']),
+        ]
+        # Name search indexes (pg_trgm GIN / SQLite FTS5) are created in
+        # migration 0011_product_search, see home/search.py.
+
+    @classmethod
+    def lock(cls, product_ids):
+        """
+        Lock these product rows until the transaction ends. Always lock
+        products before their orders, in pk order, so writers queue up
+        instead of deadlocking.
+        """
+        list(
+            cls.objects.select_for_update().filter(pk__in=list(product_ids))
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    @classmethod
+    def add_units_sold(cls, deltas):
+        """
+        Apply {product_id: units} changes to units_sold with F()
+        increments, one UPDATE per distinct delta.
+        """
+        by_delta = defaultdict(list)
+        for product_id, units in deltas.items():
+            if units:
+                by_delta[units].append(product_id)
+        for units, product_ids in by_delta.items():
+            cls.objects.filter(pk__in=product_ids).update(units_sold=models.F('units_sold') + units)
+
     @property
     def profit(self):
         """Profit per single product"""
         return self.price - self.cost
 
+    @property
+    def archived_completed(self):
+        """Rollup of archived completed orders (None if nothing archived)"""
+        # Iterate .all() so a prefetch_related('order_rollups') is reused
+        for rollup in self.order_rollups.all():
+            if rollup.status == 'completed':
+                return rollup
+        return None
+
     @property
     def orders_completed(self):
         """Number of completed orders for this product"""
-        return self.orders.filter(status='completed').count()
+        archived = self.archived_completed
+        count = self.orders.filter(status='completed').count()
+        return count + (archived.order_count if archived else 0)
 
     @property
     def total_revenue(self):
         """Total revenue from completed orders"""
         completed_orders = self.orders.filter(status='completed')
-        return sum(order.total_price for order in completed_orders)
+        archived = self.archived_completed
+        return sum(order.total_price for order in completed_orders) + (archived.revenue if archived else 0)
 
     @property
     def total_quantity_sold(self):
         """Total quantity sold across completed orders"""
         completed_orders = self.orders.filter(status='completed')
-        return sum(order.quantity for order in completed_orders)
+        archived = self.archived_completed
+        return sum(order.quantity for order in completed_orders) + (archived.units if archived else 0)
 
     def __str__(self):
         return self.name
@@ -57,12 +114,50 @@ class Order(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    etsy_transaction_id = models.BigIntegerField(unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['-created_at']),
+        ]
+
+    @staticmethod
+    def sold_units(status, quantity):
+        """Units an order in this state adds to Product.units_sold"""
+        return quantity if status == 'completed' else 0
+
+    def _lock_saved(self):
+        """Lock the stored row (and its products); returns (product_id, status, quantity) or None"""
+        # The order may have moved from another product
+        product_ids = {self.product_id}
+        product_ids.update(Order.objects.filter(pk=self.pk).values_list('product_id', flat=True))
+        Product.lock(product_ids)
+        return (
+            Order.objects.select_for_update().filter(pk=self.pk)
+            .values_list('product_id', 'status', 'quantity').first()
+        )
+
     def save(self, *args, **kwargs):
         # Automatically calculate total price
         self.total_price = self.product.price * self.quantity
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            old = self._lock_saved() if self.pk else None
+            super().save(*args, **kwargs)
+            deltas = defaultdict(int)
+            deltas[self.product_id] += Order.sold_units(self.status, self.quantity)
+            if old:
+                deltas[old[0]] -= Order.sold_units(old[1], old[2])
+            Product.add_units_sold(deltas)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            old = self._lock_saved()
+            result = super().delete(*args, **kwargs)
+            if old:
+                Product.add_units_sold({old[0]: -Order.sold_units(old[1], old[2])})
+        return result
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity} by {self.user.email}"
@@ -70,8 +165,178 @@ class Order(models.Model):
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    etsy_access_token = models.CharField(max_length=255, blank=True, null=True)
-    canva_access_token = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return self.user.username
+
+
+# --------------------------
+# OAuth Tokens
+# --------------------------
+class OAuthToken(models.Model):
+    """
+    Access/refresh token pair for an external provider. Read through
+    home.tokens.tokens, which refreshes and caches them.
+    """
+    PROVIDER_CHOICES = [
+        ('etsy', 'Etsy'),
+        ('canva', 'Canva'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='oauth_tokens')
+    provider = models.CharField(max_length=10, choices=PROVIDER_CHOICES)
+    access_token = models.TextField()
+    refresh_token = models.TextField(blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    scope = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'provider'], name='unique_oauth_token_user_provider'),
+        ]
+
+    def needs_refresh(self, margin):
+        return self.expires_at is not None and self.expires_at - margin <= timezone.now()
+
+    def __str__(self):
+        return f"{self.provider} token for {self.user.username}"
+
+# --------------------------
+# Archived Orders
+# --------------------------
+class ArchivedOrder(models.Model):
+    """
+    Cold copy of an Order moved out of the hot table by home.archive.
+    Keeps the original primary key so archived rows can be traced back.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_orders')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    quantity = models.PositiveIntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    etsy_transaction_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity} by {self.user.email} (archived)"
+
+
+class OrderRollup(models.Model):
+    """
+    Running totals of archived orders per product and status, so
+    dashboard totals stay correct without reading ArchivedOrder.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_rollups')
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'status'], name='unique_rollup_product_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} ({self.status}): {self.order_count} orders"
+
+
+# --------------------------
+# Background Jobs
+# --------------------------
+class Job(models.Model):
+    """
+    A unit of work for the database-backed queue in home.jobs.
+    Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at']),
+            models.Index(fields=['name', 'user', '-created_at']),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+# --------------------------
+# Etsy Webhook Ingestion Log
+# --------------------------
+class WebhookEvent(models.Model):
+    """
+    Raw Etsy webhook delivery, appended by the webhook view and applied
+    to Order/Product later in batches by home.webhooks.drain_events.
+    """
+    event_id = models.CharField(max_length=100, db_index=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id}"
+
+
+# --------------------------
+# Request Profiles
+# --------------------------
+class RequestProfile(models.Model):
+    """
+    Metadata for one profiled request; the pstats, collapsed-stack and
+    SQL files live on disk under PROFILE_DIR (see home.profiling).
+    """
+    path = models.CharField(max_length=500)
+    method = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_ms = models.FloatField()
+    file_prefix = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,192 @@
+"""
+On-demand request profiling for superusers.
+
+Add ?_profile=1 (or an X-Profile: 1 header) to any URL while logged in
+as a superuser. The rest of the middleware chain and the view run under
+cProfile, with a background thread sampling the request's Python stack
+every PROFILE_SAMPLE_INTERVAL seconds. SQL statements are also captured
+along with the project frame that issued them.
+
+Results are written to PROFILE_DIR as:
+    <prefix>.pstats     cProfile output (snakeviz, pstats)
+    <prefix>.collapsed  folded stacks (flamegraph.pl, speedscope)
+    <prefix>.sql.json   statements, durations and stack origins
+and listed in the admin under Request profiles. Only the newest
+PROFILE_MAX_COUNT profiles are kept.
+
+cProfile hooks the whole interpreter (sys.monitoring on Python 3.12+), so
+one request is profiled at a time per process; a flagged request that
+arrives while another is being profiled is served normally with an
+X-Profile-Skipped header.
+
+Requests without the flag only pay for two membership checks.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+QUERY_PARAM = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+PROFILE_SUFFIXES = {'pstats': '.pstats', 'collapsed': '.collapsed', 'sql': '.sql.json'}
+
+_profiler_lock = threading.Lock()
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's stack and counts folded stack strings."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class QueryRecorder:
+    """DB execute wrapper recording SQL, timing and the calling project frame."""
+
+    def __init__(self):
+        self.queries = []
+        self.project_root = str(settings.BASE_DIR)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+                'stack': self._origin(),
+            })
+
+    def _origin(self):
+        frames = traceback.extract_stack()[:-2]
+        return [
+            f"{os.path.relpath(f.filename, self.project_root)}:{f.lineno} in {f.name}"
+            for f in frames
+            if f.filename.startswith(self.project_root) and not f.filename.endswith('profiling.py')
+        ][-5:]
+
+
+class ProfilerMiddleware:
+    """
+    Must come after AuthenticationMiddleware. Set PROFILING_ENABLED=False
+    to drop it from the middleware chain entirely.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if QUERY_PARAM not in request.GET and HEADER not in request.META:
+            return self.get_response(request)
+        if not (request.user.is_authenticated and request.user.is_superuser):
+            return self.get_response(request)
+        if not _profiler_lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile-Skipped'] = 'busy'
+            return response
+        try:
+            return self._profile(request)
+        finally:
+            _profiler_lock.release()
+
+    def _profile(self, request):
+        from .models import RequestProfile
+
+        recorder = QueryRecorder()
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+        profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            sampler.start()
+            try:
+                response = profiler.runcall(self.get_response, request)
+            finally:
+                sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        prefix = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        base = os.path.join(settings.PROFILE_DIR, prefix)
+        profiler.dump_stats(f"{base}.pstats")
+        with open(f"{base}.collapsed", 'w') as f:
+            f.write(sampler.collapsed())
+        with open(f"{base}.sql.json", 'w') as f:
+            json.dump(recorder.queries, f, indent=2)
+
+        profile = RequestProfile.objects.create(
+            path=request.get_full_path()[:500],
+            method=request.method,
+            status_code=response.status_code,
+            user=request.user,
+            duration_ms=round(duration_ms, 2),
+            query_count=len(recorder.queries),
+            query_ms=round(sum(q['ms'] for q in recorder.queries), 2),
+            file_prefix=prefix,
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        prune_profiles()
+        return response
+
+
+def profile_file_path(profile, kind):
+    """Absolute path of a stored profile file; kind is pstats/collapsed/sql."""
+    return os.path.join(settings.PROFILE_DIR, profile.file_prefix + PROFILE_SUFFIXES[kind])
+
+
+def prune_profiles(keep=None):
+    """
+    Delete all but the newest `keep` (default PROFILE_MAX_COUNT) profiles,
+    files included. Returns the number of profiles removed.
+    """
+    from .models import RequestProfile
+
+    keep = settings.PROFILE_MAX_COUNT if keep is None else keep
+    old = list(RequestProfile.objects.order_by('-created_at', '-pk')[keep:])
+    for profile in old:
+        for kind in PROFILE_SUFFIXES:
+            try:
+                os.remove(profile_file_path(profile, kind))
+            except FileNotFoundError:
+                pass
+    RequestProfile.objects.filter(pk__in=[p.pk for p in old]).delete()
+    return len(old)
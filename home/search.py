@@ -0,0 +1,122 @@
+"""
+Product search and filtering for the products page.
+
+Name search uses the index available on the current database:
+- Postgres: icontains, served by the pg_trgm GIN index on UPPER(name)
+- SQLite: the home_product_fts FTS5 table (prefix match per word)
+- anything else: a plain icontains scan
+
+Both indexes are created in migration 0011_product_search. On SQLite any
+migration that rebuilds home_product drops the FTS sync triggers; the
+home.E001 database check reports that (`manage.py check --database default`).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.core import checks
+from django.db import connection
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+SORT_CHOICES = [
+    ('newest', 'Newest'),
+    ('profit', 'Highest profit'),
+    ('units_sold', 'Most units sold'),
+    ('price', 'Lowest price'),
+]
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+def _fts5_query(q):
+    # Quote every word so user input can't inject FTS5 syntax
+    words = q.split()
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+FTS_TRIGGERS = {'home_product_fts_ai', 'home_product_fts_ad', 'home_product_fts_au'}
+
+_fts_tables = {}
+
+
+def _has_fts():
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        _fts_tables[name] = 'home_product_fts' in connection.introspection.table_names()
+    return _fts_tables[name]
+
+
+def missing_fts_triggers(conn=connection):
+    """FTS sync triggers absent from a SQLite database that has the FTS table."""
+    if conn.vendor != 'sqlite' or 'home_product_fts' not in conn.introspection.table_names():
+        return set()
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'home_product'")
+        return FTS_TRIGGERS - {row[0] for row in cursor.fetchall()}
+
+
+@checks.register(checks.Tags.database)
+def check_fts_triggers(app_configs, databases=None, **kwargs):
+    from django.db import connections
+
+    errors = []
+    for alias in databases or []:
+        missing = missing_fts_triggers(connections[alias])
+        if missing:
+            errors.append(checks.Error(
+                f"SQLite FTS sync triggers missing on '{alias}': {', '.join(sorted(missing))}",
+                hint="A migration rebuilt home_product; recreate the triggers as in 0013_product_units_sold.",
+                id='home.E001',
+            ))
+    return errors
+
+
+def _name_search(products, q):
+    if connection.vendor == 'sqlite' and _has_fts():
+        return products.filter(pk__in=RawSQL(
+            "SELECT rowid FROM home_product_fts WHERE home_product_fts MATCH %s",
+            [_fts5_query(q)],
+        ))
+    return products.filter(name__icontains=q)
+
+
+def search_products(params):
+    """
+    Filtered, sorted Product queryset for a dict of GET parameters:
+    q, status, min_price, max_price, min_cost, max_cost, sort.
+    """
+    products = Product.objects.all()
+
+    q = (params.get('q') or '').strip()
+    if q:
+        products = _name_search(products, q)
+
+    status = params.get('status')
+    if status in dict(Product.STATUS_CHOICES):
+        products = products.filter(status=status)
+
+    for param, lookup in [
+        ('min_price', 'price__gte'), ('max_price', 'price__lte'),
+        ('min_cost', 'cost__gte'), ('max_cost', 'cost__lte'),
+    ]:
+        value = _decimal(params.get(param))
+        if value is not None:
+            products = products.filter(**{lookup: value})
+
+    sort = params.get('sort')
+    if sort == 'profit':
+        products = products.order_by((F('price') - F('cost')).desc(), '-pk')
+    elif sort == 'units_sold':
+        # Denormalized counter, served by the (-units_sold, -id) index
+        products = products.order_by('-units_sold', '-pk')
+    elif sort == 'price':
+        products = products.order_by('price', 'pk')
+    else:
+        products = products.order_by('-created_at', '-pk')
+    return products
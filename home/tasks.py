@@ -0,0 +1,65 @@
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .canva import fetch_thumbnails
+from .jobs import task
+from .models import Product
+from .tokens import tokens
+
+
+@task('generate_products')
+def generate_products(payload):
+    """
+    Create `count` products with randomized prices and costs.
+    """
+    count = int(payload['count'])
+    base_name = payload.get('base_name') or 'Product'
+    status = payload.get('status', 'active')
+
+    products = []
+    for i in range(1, count + 1):
+        price = round(random.uniform(5, 50), 2)  # Price between $5 and $50
+        cost = round(random.uniform(1, price - 1), 2)  # Cost less than price
+        products.append(Product(name=f"{base_name} #{i}", price=price, cost=cost, status=status))
+    Product.objects.bulk_create(products, batch_size=1000)
+    return {'created': count}
+
+
+@task('etsy_fetch_listings')
+def etsy_fetch_listings(payload):
+    """
+    Fetch the shop listings for a user's connected Etsy account.
+    """
+    user = User.objects.get(pk=payload['user_id'])
+    if not tokens.has_token(user, 'etsy'):
+        return {'error': 'Etsy account not connected'}
+
+    shop_id = "YOUR_SHOP_ID"  # Replace with actual shop ID
+    response = tokens.request(
+        user, 'etsy', 'GET',
+        f"{settings.ETSY_API_BASE}/application/shops/{shop_id}/listings",
+    )
+    # 4xx/5xx raise so the queue retries with backoff
+    response.raise_for_status()
+    if response.status_code != 200:
+        # e.g. 204: nothing to parse, and retrying won't help
+        return {'error': f"Unexpected Etsy response: {response.status_code}"}
+    return response.json()
+
+
+@task('canva_fetch_thumbnails')
+def canva_fetch_thumbnails(payload):
+    """
+    Fetch Canva thumbnails for the given designs into the local cache.
+    """
+    user = User.objects.get(pk=payload['user_id'])
+    if not tokens.has_token(user, 'canva'):
+        return {'error': 'Canva account not connected'}
+
+    results = fetch_thumbnails(user, payload['design_ids'])
+    return {
+        'fetched': sum(1 for digest in results.values() if digest),
+        'failed': [design_id for design_id, digest in results.items() if not digest],
+    }
@@ -1,3 +1,945 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .archive import archive_orders
+from .canva import ThumbnailCache, fetch_thumbnails
+from .db import statement_timeout
+from .jobs import claim_job, enqueue, requeue_stale_jobs, run_job, task, work
+from .loadtest import HttpConnection, _webhook_request, cleanup_load_data, start_etsy_stub, summarize
+from .models import (
+    ArchivedOrder, Job, OAuthToken, Order, OrderRollup, Product, Profile, RequestProfile, WebhookEvent,
+)
+from .paginators import EstimatedCountPaginator
+from .profiling import _profiler_lock
+from .search import check_fts_triggers, missing_fts_triggers
+from .tokens import TokenError, tokens
+from .webhooks import _upsert_orders, drain_events, sign_payload
+
+
+# ---------------------------
+# Sessions & Auth Backend
+# ---------------------------
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class SessionQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user, backend='home.backends.ProfileModelBackend')
+
+    def test_dashboard_skips_session_and_profile_queries(self):
+        url = reverse('dashboard')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+
+        sql = [q['sql'] for q in ctx.captured_queries]
+        # Session comes from the cache, never from django_session.
+        self.assertFalse([s for s in sql if 'django_session' in s])
+        # User and Profile are loaded by a single joined query.
+        user_queries = [s for s in sql if 'FROM "auth_user"' in s]
+        self.assertEqual(len(user_queries), 1)
+        self.assertIn('home_profile', user_queries[0])
+        self.assertFalse([s for s in sql if 'FROM "home_profile"' in s])
+
+    def test_user_without_profile(self):
+        Profile.objects.all().delete()
+        response = self.client.get(reverse('dashboard'), secure=True)
+        self.assertEqual(response.status_code, 200)
+
+
+# ---------------------------
+# Static Assets
+# ---------------------------
+class StaticAssetTests(TestCase):
+    def test_vendored_asset_is_hashed_and_precompressed(self):
+        from django.templatetags.static import static
+
+        url = static('vendor/bootstrap/css/bootstrap.min.css')
+        self.assertRegex(url, r'bootstrap\.min\.[0-9a-f]{12}\.css$')
+
+        response = self.client.get(url, secure=True, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+
+    def test_login_page_has_no_cdn_links(self):
+        response = self.client.get(reverse('login'), secure=True)
+        self.assertNotContains(response, 'cdn.jsdelivr.net')
+
+
+# ---------------------------
+# Statement Timeouts & Pool
+# ---------------------------
+class StatementTimeoutTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+
+    def test_view_runs_normally(self):
+        @statement_timeout(timeout_ms=1000)
+        def view(request):
+            return HttpResponse('ok')
+
+        self.assertEqual(view(self.request).content, b'ok')
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'requires PostgreSQL')
+    def test_slow_query_is_cancelled(self):
+        @statement_timeout(timeout_ms=50)
+        def view(request):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(1)')
+            return HttpResponse('ok')
+
+        self.assertEqual(view(self.request).status_code, 503)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'requires PostgreSQL')
+    def test_timeout_is_transaction_local(self):
+        @statement_timeout(timeout_ms=1234)
+        def view(request):
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW statement_timeout')
+                return HttpResponse(cursor.fetchone()[0])
+
+        self.assertEqual(view(self.request).content, b'1234ms')
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertNotEqual(cursor.fetchone()[0], '1234ms')
+
+    def test_pool_stats_requires_superuser(self):
+        user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        self.client.force_login(user)
+        response = self.client.get(reverse('db_pool_stats'), secure=True)
+        self.assertEqual(response.status_code, 302)
+
+        user.is_superuser = True
+        user.save()
+        response = self.client.get(reverse('db_pool_stats'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('pooling', response.json())
+
+
+# ---------------------------
+# Admin
+# ---------------------------
+class OrderAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        for i in range(5):
+            product = Product.objects.create(name=f'Product #{i}', price=10, cost=2)
+            Order.objects.create(product=product, user=self.admin, quantity=i + 1)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:home_order_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url, secure=True)
+        baseline = len(ctx.captured_queries)
+
+        product = Product.objects.create(name='Extra', price=5, cost=1)
+        Order.objects.create(product=product, user=self.admin)
+        with self.assertNumQueries(baseline):
+            response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_status_action_is_single_update(self):
+        ids = list(Order.objects.values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('admin:home_order_changelist'), {
+                'action': 'mark_completed',
+                '_selected_action': ids,
+            }, secure=True)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "home_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Order.objects.filter(status='completed').count(), len(ids))
+
+    def test_paginator_counts_exactly_off_postgres(self):
+        paginator = EstimatedCountPaginator(Order.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.count, 5)
+
+    def test_paginator_uses_explain_estimate_for_filtered_querysets(self):
+        qs = Order.objects.filter(status='pending').order_by('pk')
+        plan = {'Plan': {'Node Type': 'Seq Scan', 'Plan Rows': 250000}}
+        # psycopg 3 yields the plan object, older drivers a one-item list
+        for explained in (plan, [plan]):
+            with self.subTest(shape=type(explained).__name__), \
+                    mock.patch.object(connection, 'vendor', 'postgresql'), \
+                    mock.patch.object(QuerySet, 'explain', return_value=json.dumps(explained)):
+                paginator = EstimatedCountPaginator(qs, 2)
+                with self.assertNumQueries(0):
+                    self.assertEqual(paginator.count, 250000)
+
+        # Small estimates fall back to an exact count
+        small = {'Plan': {'Plan Rows': 40}}
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(QuerySet, 'explain', return_value=json.dumps(small)):
+            self.assertEqual(EstimatedCountPaginator(qs, 2).count, 5)
+
+
+# ---------------------------
+# Order Archiving
+# ---------------------------
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        self.client.force_login(self.user)
+        self.product = Product.objects.create(name='Planner', price=10, cost=2)
+        old = timezone.now() - datetime.timedelta(days=1000)
+        for status in ['completed', 'completed', 'canceled', 'pending']:
+            Order.objects.create(product=self.product, user=self.user, quantity=2, status=status)
+        Order.objects.update(created_at=old)
+        # One recent completed order stays hot
+        Order.objects.create(product=self.product, user=self.user, quantity=1, status='completed')
+
+    def _revenue_context(self):
+        return self.client.get(reverse('revenue'), secure=True).context
+
+    def test_archive_moves_cold_orders_in_batches(self):
+        self.assertEqual(archive_orders(batch_size=1, max_batches=2), 2)
+        self.assertEqual(archive_orders(batch_size=1), 1)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+        self.assertEqual(Order.objects.filter(status='pending').count(), 1)
+
+        rollup = OrderRollup.objects.get(product=self.product, status='completed')
+        self.assertEqual((rollup.order_count, rollup.units, rollup.revenue), (2, 4, 40))
+
+    def test_totals_unchanged_after_archiving(self):
+        before = self._revenue_context()
+        archive_orders()
+        after = self._revenue_context()
+        for key in ['total_orders', 'total_units', 'total_revenue', 'canceled_orders']:
+            self.assertEqual(before[key], after[key], key)
+        self.assertEqual(self.product.total_quantity_sold, 5)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.units_sold, 5)
+
+    def test_reports_can_opt_in_to_archived_rows(self):
+        Order.objects.filter(created_at__gte=timezone.now() - datetime.timedelta(days=1)).delete()
+        archive_orders()
+        self.assertEqual(self._revenue_context()['active_customers'], 0)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('revenue') + '?include_archived=1', secure=True)
+        self.assertEqual(response.context['active_customers'], 1)
+        self.assertEqual(response.context['repeat_customers'], 1)
+        self.assertEqual(response.context['avg_orders_per_customer'], 2)
+        # Hot and archived orders are grouped separately, never joined
+        archived_sql = [q['sql'] for q in ctx.captured_queries if 'home_archivedorder' in q['sql']]
+        self.assertTrue(archived_sql)
+        self.assertFalse([sql for sql in archived_sql if '"home_order"' in sql])
+
+    def test_customer_average_is_stable_with_archived_rows(self):
+        url = reverse('revenue') + '?include_archived=1'
+        before = self.client.get(url, secure=True).context['avg_orders_per_customer']
+        archive_orders()
+        self.assertEqual(self.client.get(url, secure=True).context['avg_orders_per_customer'], before)
+        # The default view averages hot orders over hot customers
+        self.assertEqual(self._revenue_context()['avg_orders_per_customer'], 1)
+
+    def test_dashboard_best_sellers_include_rollups(self):
+        Order.objects.filter(created_at__gte=timezone.now() - datetime.timedelta(days=1)).delete()
+        archive_orders()
+        context = self.client.get(reverse('dashboard'), secure=True).context
+        self.assertEqual(context['most_selling_product'], self.product)
+        self.assertEqual(context['most_profitable_product'], self.product)
+
+
+# ---------------------------
+# Background Jobs
+# ---------------------------
+@task('test_flaky')
+def _flaky(payload):
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        self.client.force_login(self.user)
+
+    def test_generate_products_returns_job_immediately(self):
+        response = self.client.post(reverse('generate_products'), {
+            'count': 3, 'base_name': 'Resume', 'status': 'active',
+        }, secure=True)
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('job_detail', args=[job.pk]), fetch_redirect_response=False)
+        self.assertEqual(Product.objects.count(), 0)
+
+        self.assertEqual(work(burst=True), 1)
+        self.assertEqual(Product.objects.count(), 3)
+
+        status = self.client.get(reverse('job_status', args=[job.pk]), secure=True).json()
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['result'], {'created': 3})
+
+    def test_claim_order_respects_priority(self):
+        low = enqueue('generate_products', {'count': 1})
+        high = enqueue('generate_products', {'count': 1}, priority=10)
+        self.assertEqual(claim_job('w1').pk, high.pk)
+        self.assertEqual(claim_job('w2').pk, low.pk)
+        self.assertIsNone(claim_job('w3'))
+
+    def test_failed_job_retries_with_backoff(self):
+        job = enqueue('test_flaky', max_attempts=2)
+        run_job(claim_job('w1'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+        # Not runnable until the backoff has elapsed
+        self.assertIsNone(claim_job('w1'))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        run_job(claim_job('w1'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        stale = timezone.now() - datetime.timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS + 1)
+        retryable = enqueue('generate_products', {'count': 1})
+        exhausted = enqueue('generate_products', {'count': 1}, max_attempts=1)
+        healthy = enqueue('generate_products', {'count': 1})
+        Job.objects.update(status='running', locked_by='dead', attempts=1, locked_at=stale)
+        Job.objects.filter(pk=healthy.pk).update(locked_at=timezone.now())
+
+        self.assertEqual(requeue_stale_jobs(), 2)
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {retryable.pk: 'queued', exhausted.pk: 'failed', healthy.pk: 'running'})
+        self.assertIn('Worker stopped responding', Job.objects.get(pk=exhausted.pk).last_error)
+
+    @mock.patch('home.tokens.requests.request')
+    def test_etsy_job_result_for_unexpected_responses(self, request):
+        tokens.clear()
+        tokens.store(self.user, 'etsy', {'access_token': 'a1', 'refresh_token': 'r1', 'expires_in': 3600})
+        request.return_value = mock.Mock(status_code=204)
+        job = enqueue('etsy_fetch_listings', {'user_id': self.user.pk}, user=self.user)
+        run_job(claim_job('w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('succeeded', {'error': 'Unexpected Etsy response: 204'}))
+
+        # Errors raise, so the queue retries them
+        request.return_value = mock.Mock(status_code=503, **{'raise_for_status.side_effect': requests.HTTPError('503')})
+        job = enqueue('etsy_fetch_listings', {'user_id': self.user.pk}, user=self.user)
+        run_job(claim_job('w1'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+
+    def test_jobs_are_private_to_their_owner(self):
+        other = User.objects.create_user('other', 'other@example.com', 'secret')
+        job = enqueue('generate_products', {'count': 1}, user=other)
+        response = self.client.get(reverse('job_status', args=[job.pk]), secure=True)
+        self.assertEqual(response.status_code, 404)
+
+
+# ---------------------------
+# Etsy Webhooks
+# ---------------------------
+@override_settings(ETSY_WEBHOOK_SECRET='test-secret')
+class EtsyWebhookTests(TestCase):
+    def _post(self, event_id, payload, signature=None):
+        body = json.dumps(payload).encode()
+        timestamp = str(int(time.time()))
+        return self.client.post(
+            reverse('etsy_webhook'), body, content_type='application/json', secure=True,
+            headers={
+                'webhook-id': event_id,
+                'webhook-timestamp': timestamp,
+                'webhook-signature': signature or sign_payload(event_id, timestamp, body),
+            },
+        )
+
+    def _order(self, transaction_id, event_type='order.paid', quantity=2):
+        return {'event_type': event_type, 'data': {
+            'transaction_id': transaction_id, 'listing_id': 55, 'quantity': quantity,
+            'price': '4.50', 'buyer_user_id': 9, 'buyer_email': 'buyer@example.com',
+        }}
+
+    def test_rejects_bad_signature(self):
+        response = self._post('evt-1', self._order(1), signature='v1,bogus')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_events_are_logged_then_applied_in_batch(self):
+        self.assertEqual(self._post('evt-1', {'event_type': 'listing.created', 'data': {
+            'listing_id': 55, 'title': 'Resume Template', 'price': '4.50', 'state': 'active',
+        }}).status_code, 202)
+        self._post('evt-2', self._order(100, 'order.created'))
+        self._post('evt-3', self._order(100, 'order.paid'))
+        self._post('evt-3', self._order(100, 'order.canceled'))  # redelivery, same id
+        self._post('evt-4', self._order(101, quantity=1))
+        self.assertEqual(Order.objects.count(), 0)
+
+        self.assertEqual(drain_events(), 5)
+        product = Product.objects.get(etsy_listing_id=55)
+        self.assertEqual(product.name, 'Resume Template')
+        order = Order.objects.get(etsy_transaction_id=100)
+        self.assertEqual((order.status, order.quantity, order.total_price), ('completed', 2, 9))
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(WebhookEvent.objects.filter(error='duplicate').count(), 1)
+        self.assertEqual(Product.objects.get(etsy_listing_id=55).units_sold, 3)
+
+        # A late redelivery of an applied event is still ignored
+        self._post('evt-3', self._order(100, 'order.canceled'))
+        drain_events()
+        self.assertEqual(Order.objects.get(etsy_transaction_id=100).status, 'completed')
+
+    def test_units_sold_follows_status_and_quantity_changes(self):
+        self._post('evt-1', self._order(100))
+        drain_events()
+        self.assertEqual(Product.objects.get(etsy_listing_id=55).units_sold, 2)
+        self._post('evt-2', self._order(100, quantity=3))
+        self._post('evt-3', self._order(101, 'order.created', quantity=4))
+        drain_events()
+        self.assertEqual(Product.objects.get(etsy_listing_id=55).units_sold, 3)
+        self._post('evt-4', self._order(100, 'order.canceled', quantity=3))
+        self._post('evt-5', self._order(101, quantity=4))
+        drain_events()
+        self.assertEqual(Product.objects.get(etsy_listing_id=55).units_sold, 4)
+
+    def test_late_created_event_does_not_regress_status(self):
+        # Out of order within one batch
+        self._post('evt-1', self._order(200, 'order.paid'))
+        self._post('evt-2', self._order(200, 'order.created'))
+        # ... and across batches
+        self._post('evt-3', self._order(201, 'order.canceled'))
+        drain_events()
+        self._post('evt-4', self._order(201, 'order.created'))
+        drain_events()
+
+        statuses = dict(Order.objects.values_list('etsy_transaction_id', 'status'))
+        self.assertEqual(statuses, {200: 'completed', 201: 'canceled'})
+
+        # Moving between terminal statuses (a refund) still applies
+        self._post('evt-5', self._order(200, 'order.canceled'))
+        drain_events()
+        self.assertEqual(Order.objects.get(etsy_transaction_id=200).status, 'canceled')
+
+    def test_bad_event_does_not_block_the_batch(self):
+        bad = [
+            self._order(300, quantity=-1),
+            {**self._order(301), 'data': {**self._order(301)['data'], 'price': '99999999.99'}},
+            {**self._order(302), 'data': {**self._order(302)['data'], 'transaction_id': 2 ** 70}},
+        ]
+        for i, payload in enumerate(bad):
+            self._post(f'evt-bad-{i}', payload)
+        self._post('evt-good', self._order(303))
+
+        self.assertEqual(drain_events(), 4)
+        self.assertEqual(list(Order.objects.values_list('etsy_transaction_id', flat=True)), [303])
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+        errors = WebhookEvent.objects.filter(event_id__startswith='evt-bad').values_list('error', flat=True)
+        self.assertTrue(all(e.startswith('invalid payload') for e in errors), list(errors))
+
+    def test_database_error_is_isolated_to_its_event(self):
+        def upsert(orders):
+            if 400 in orders:
+                raise IntegrityError('simulated constraint failure')
+            return _upsert_orders(orders)
+
+        self._post('evt-1', self._order(400))
+        self._post('evt-2', self._order(401))
+        with mock.patch('home.webhooks._upsert_orders', side_effect=upsert):
+            self.assertEqual(drain_events(), 2)
+            self.assertEqual(drain_events(), 0)
+
+        self.assertEqual(list(Order.objects.values_list('etsy_transaction_id', flat=True)), [401])
+        failed = WebhookEvent.objects.get(event_id='evt-1')
+        self.assertIsNotNone(failed.processed_at)
+        self.assertIn('simulated constraint failure', failed.error)
+
+    def test_order_before_listing_creates_placeholder(self):
+        self._post('evt-1', self._order(7))
+        drain_events()
+        order = Order.objects.select_related('product', 'user').get()
+        self.assertEqual(order.product.etsy_listing_id, 55)
+        self.assertEqual(order.user.email, 'buyer@example.com')
+        self.assertFalse(order.user.is_active)
+
+
+# ---------------------------
+# Canva Thumbnails
+# ---------------------------
+PNG = b'\x89PNG\r\n\x1a\n'
+
+
+class CanvaStubHandler(BaseHTTPRequestHandler):
+    """Minimal local stand-in for the Canva Connect API."""
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts[0] == 'designs' and parts[1] != 'missing':
+            if self.headers.get('Authorization') != 'Bearer canva-token':
+                return self._send(401, b'{}')
+            base = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+            body = json.dumps({'design': {
+                'id': parts[1], 'title': parts[1],
+                'thumbnail': {'url': f"{base}/thumbs/{parts[1]}", 'width': 10, 'height': 10},
+            }}).encode()
+            return self._send(200, body, 'application/json')
+        if parts[0] == 'thumbs':
+            return self._send(200, PNG + parts[1].encode() * 100, 'image/png')
+        self._send(404, b'{}')
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CanvaThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), CanvaStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        overrides = override_settings(CANVA_API_BASE=self.api_base, CANVA_THUMBNAIL_DIR=self.cache_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        tokens.clear()
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        OAuthToken.objects.create(user=self.user, provider='canva', access_token='canva-token')
+
+    def test_fetches_concurrently_into_content_addressed_cache(self):
+        results = fetch_thumbnails(self.user, ['d1', 'd2', 'd1', 'missing'], max_workers=4)
+        self.assertEqual(set(results), {'d1', 'd2', 'missing'})
+        self.assertIsNone(results['missing'])
+
+        cache = ThumbnailCache()
+        self.assertEqual(cache.digest_for('d1'), results['d1'])
+        with cache.open(results['d2']) as f:
+            self.assertTrue(f.read().startswith(PNG))
+
+    def test_evicts_least_recently_used(self):
+        cache = ThumbnailCache(max_bytes=500)
+        old = cache.put('old', PNG + b'a' * 300)
+        new = cache.put('new', PNG + b'b' * 300)
+        past = time.time() - 100
+        os.utime(cache.blob_path(old), (past, past))
+        cache.evict()
+        self.assertIsNone(cache.digest_for('old'))
+        self.assertEqual(cache.digest_for('new'), new)
+
+    def test_products_page_queues_fetch_and_serves_cached_thumbnail(self):
+        Product.objects.create(name='Resume', price=10, cost=2, canva_design_id='d9')
+        self.client.force_login(self.user)
+
+        self.client.get(reverse('products'), secure=True)
+        job = Job.objects.get(name='canva_fetch_thumbnails')
+        self.assertEqual(job.payload['design_ids'], ['d9'])
+        work(burst=True)
+
+        digest = ThumbnailCache().digest_for('d9')
+        response = self.client.get(reverse('products'), secure=True)
+        self.assertContains(response, reverse('canva_thumbnail', args=[digest]))
+
+        response = self.client.get(reverse('canva_thumbnail', args=[digest]), secure=True)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+        self.assertEqual(self.client.get(reverse('canva_thumbnail', args=['nope']), secure=True).status_code, 404)
+
+
+# ---------------------------
+# OAuth Token Manager
+# ---------------------------
+def _token_response(access_token, refresh_token='refresh-2', expires_in=3600):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = {
+        'access_token': access_token, 'refresh_token': refresh_token, 'expires_in': expires_in,
+    }
+    return response
+
+
+class TokenManagerTests(TestCase):
+    def setUp(self):
+        tokens.clear()
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+
+    def test_valid_token_is_served_from_memory(self):
+        tokens.store(self.user, 'etsy', {'access_token': 'a1', 'refresh_token': 'r1', 'expires_in': 3600})
+        with self.assertNumQueries(0):
+            self.assertEqual(tokens.get_access_token(self.user, 'etsy'), 'a1')
+
+    def test_missing_token(self):
+        with self.assertRaises(TokenError):
+            tokens.get_access_token(self.user, 'canva')
+        self.assertFalse(tokens.has_token(self.user, 'canva'))
+
+    @mock.patch('home.tokens.requests.post')
+    def test_refreshes_before_expiry(self, post):
+        post.return_value = _token_response('a2')
+        tokens.store(self.user, 'etsy', {'access_token': 'a1', 'refresh_token': 'r1', 'expires_in': 60})
+
+        self.assertEqual(tokens.get_access_token(self.user, 'etsy'), 'a2')
+        self.assertEqual(post.call_args.kwargs['data']['refresh_token'], 'r1')
+        token = OAuthToken.objects.get(user=self.user, provider='etsy')
+        self.assertEqual((token.access_token, token.refresh_token), ('a2', 'refresh-2'))
+
+    @mock.patch('home.tokens.requests.post')
+    def test_unauthorized_response_forces_refresh_and_retry(self, post):
+        post.return_value = _token_response('fresh')
+        tokens.store(self.user, 'canva', {'access_token': 'stale', 'refresh_token': 'r1', 'expires_in': 3600})
+        session = mock.Mock()
+        session.request.side_effect = [mock.Mock(status_code=401), mock.Mock(status_code=200)]
+
+        response = tokens.request(self.user, 'canva', 'GET', 'https://example.invalid/designs', session=session)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.request.call_args.kwargs['headers']['Authorization'], 'Bearer fresh')
+        self.assertEqual(post.call_count, 1)
+
+    @mock.patch('home.tokens.requests.post')
+    def test_refresh_errors_raise_token_error(self, post):
+        tokens.store(self.user, 'etsy', {'access_token': 'a1', 'refresh_token': 'r1', 'expires_in': 60})
+        bad_json = mock.Mock(status_code=200)
+        bad_json.json.side_effect = ValueError('not json')
+        for failure in (requests.ConnectionError('unreachable'), bad_json):
+            with self.subTest(failure=failure):
+                tokens.clear()
+                post.side_effect = failure if isinstance(failure, Exception) else None
+                post.return_value = failure
+                with self.assertRaises(TokenError):
+                    tokens.get_access_token(self.user, 'etsy')
+
+    @mock.patch('home.tokens.requests.post')
+    def test_dashboard_never_refreshes(self, post):
+        post.side_effect = requests.ConnectionError('unreachable')
+        tokens.store(self.user, 'etsy', {'access_token': 'a1', 'refresh_token': 'r1', 'expires_in': 60})
+        tokens.clear()
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('dashboard'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        post.assert_not_called()
+        # The listings job does the refresh instead
+        self.assertTrue(Job.objects.filter(name='etsy_fetch_listings', user=self.user).exists())
+        self.assertTrue(tokens.has_token(self.user, 'etsy'))
+        self.assertFalse(tokens.has_token(self.user, 'canva'))
+
+
+@task('test_slow')
+def _slow(payload):
+    time.sleep(0.5)
+    # What another worker's sweep would find while this job still runs
+    return {'recovered': requeue_stale_jobs()}
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    @override_settings(JOB_HEARTBEAT_SECONDS=0.05, JOB_LOCK_TIMEOUT_SECONDS=0.2)
+    def test_long_running_job_keeps_its_lock(self):
+        job = enqueue('test_slow')
+        run_job(claim_job('w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('succeeded', 1))
+        self.assertEqual(job.result, {'recovered': 0})
+
+
+class TokenRefreshConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        tokens.clear()
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        tokens.store(self.user, 'etsy', {'access_token': 'old', 'refresh_token': 'r1', 'expires_in': 10})
+        tokens.clear()
+
+    @mock.patch('home.tokens.requests.post')
+    def test_concurrent_callers_share_one_refresh(self, post):
+        def slow_refresh(*args, **kwargs):
+            time.sleep(0.2)
+            return _token_response('new')
+        post.side_effect = slow_refresh
+
+        results = []
+
+        def call():
+            try:
+                results.append(tokens.get_access_token(self.user, 'etsy'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, ['new'] * 5)
+        self.assertEqual(post.call_count, 1)
+
+
+# ---------------------------
+# Product Search
+# ---------------------------
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        self.client.force_login(self.user)
+        self.resume = Product.objects.create(name='Modern Resume Template', price=20, cost=5)
+        self.planner = Product.objects.create(name='Weekly Planner', price=8, cost=1)
+        self.cover = Product.objects.create(name='Resume Cover Letter', price=12, cost=10, status='inactive')
+        Order.objects.create(product=self.planner, user=self.user, quantity=7, status='completed')
+
+    def _names(self, **params):
+        response = self.client.get(reverse('products'), params, secure=True)
+        return [p.name for p in response.context['products']]
+
+    def test_name_search_uses_index_prefix_match(self):
+        self.assertEqual(set(self._names(q='resu')), {'Modern Resume Template', 'Resume Cover Letter'})
+        self.assertEqual(self._names(q='"planner'), ['Weekly Planner'])
+
+    def test_search_tracks_renames(self):
+        self.planner.name = 'Daily Journal'
+        self.planner.save()
+        self.assertEqual(self._names(q='journal'), ['Daily Journal'])
+        self.assertEqual(self._names(q='planner'), [])
+
+    def test_filters_combine_with_search(self):
+        self.assertEqual(self._names(q='resume', status='active'), ['Modern Resume Template'])
+        self.assertEqual(self._names(min_price='10', max_cost='6'), ['Modern Resume Template'])
+
+    def test_sorting(self):
+        self.assertEqual(self._names(sort='profit')[0], 'Modern Resume Template')
+        self.assertEqual(self._names(sort='units_sold')[0], 'Weekly Planner')
+
+    def test_units_sold_counter_follows_orders(self):
+        self.planner.refresh_from_db()
+        self.assertEqual(self.planner.units_sold, 7)
+
+        order = Order.objects.create(product=self.resume, user=self.user, quantity=9)
+        self.assertEqual(self._names(sort='units_sold')[0], 'Weekly Planner')
+        # Bulk admin action updates it too
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        self.client.post(reverse('admin:home_order_changelist'), {
+            'action': 'mark_completed', '_selected_action': [order.pk],
+        }, secure=True)
+        self.assertEqual(self._names(sort='units_sold')[0], 'Modern Resume Template')
+
+        with CaptureQueriesContext(connection) as ctx:
+            self._names(sort='units_sold')
+        sql = next(q['sql'] for q in ctx.captured_queries if 'ORDER BY' in q['sql'] and 'home_product' in q['sql'])
+        self.assertNotIn('home_order', sql)
+
+    def test_units_sold_moves_by_deltas(self):
+        def units():
+            return list(Product.objects.filter(pk__in=[self.planner.pk, self.resume.pk])
+                        .order_by('pk').values_list('units_sold', flat=True))
+
+        order = Order.objects.create(product=self.resume, user=self.user, quantity=2, status='completed')
+        self.assertEqual(units(), [2, 7])
+        order.quantity = 5
+        order.save()
+        self.assertEqual(units(), [5, 7])
+        order.product = self.planner
+        order.save()
+        self.assertEqual(units(), [0, 12])
+        order.status = 'canceled'
+        order.save()
+        self.assertEqual(units(), [0, 7])
+        order.status = 'completed'
+        order.save()
+        order.delete()
+        self.assertEqual(units(), [0, 7])
+
+        # Updates are increments, not recounts from the orders table
+        with CaptureQueriesContext(connection) as ctx:
+            Order.objects.create(product=self.planner, user=self.user, quantity=1, status='completed')
+        self.assertEqual(units(), [0, 8])
+        self.assertFalse([q for q in ctx.captured_queries if 'SUM(' in q['sql'].upper()])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 only')
+    def test_fts_triggers_survive_migrations(self):
+        self.assertEqual(missing_fts_triggers(), set())
+        self.assertEqual(check_fts_triggers(None, databases=['default']), [])
+
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER home_product_fts_au')
+        try:
+            errors = check_fts_triggers(None, databases=['default'])
+            self.assertEqual([e.id for e in errors], ['home.E001'])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TRIGGER home_product_fts_au AFTER UPDATE OF name ON home_product BEGIN "
+                    "INSERT INTO home_product_fts(home_product_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+                    "INSERT INTO home_product_fts(rowid, name) VALUES (new.id, new.name); END"
+                )
+
+    def test_paginates(self):
+        Product.objects.bulk_create([Product(name=f'Bulk #{i}', price=1, cost=0) for i in range(60)])
+        response = self.client.get(reverse('products'), {'q': 'bulk', 'page': 2}, secure=True)
+        self.assertEqual(len(response.context['products']), 10)
+        self.assertContains(response, 'Page 2 of 2')
+
+
+# ---------------------------
+# Request Profiler
+# ---------------------------
+class ProfilerTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        overrides = override_settings(PROFILE_DIR=self.profile_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        Product.objects.create(name='Planner', price=10, cost=2)
+
+    def test_superuser_request_is_profiled(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('revenue'), {'_profile': '1'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(
+            sorted(os.listdir(self.profile_dir)),
+            sorted(profile.file_prefix + suffix for suffix in ['.pstats', '.collapsed', '.sql.json']),
+        )
+        with open(os.path.join(self.profile_dir, profile.file_prefix + '.sql.json')) as f:
+            queries = json.load(f)
+        self.assertTrue(any('home/views.py' in frame for q in queries for frame in q['stack']))
+
+        download = self.client.get(reverse('profile_download', args=[profile.pk, 'pstats']), secure=True)
+        self.assertEqual(download.status_code, 200)
+        download.close()
+        admin_page = self.client.get(reverse('admin:home_requestprofile_changelist'), secure=True)
+        self.assertContains(admin_page, profile.path)
+
+    def test_flag_is_ignored_for_non_superusers(self):
+        user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        self.client.force_login(user)
+        response = self.client.get(reverse('revenue'), {'_profile': '1'}, secure=True)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_concurrent_request_is_served_unprofiled(self):
+        self.client.force_login(self.admin)
+        # Another request holds the profiler
+        with _profiler_lock:
+            response = self.client.get(reverse('revenue'), {'_profile': '1'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile-Skipped'], 'busy')
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILE_MAX_COUNT=2)
+    def test_old_profiles_are_pruned(self):
+        self.client.force_login(self.admin)
+        ids = [
+            int(self.client.get(reverse('revenue'), {'_profile': '1'}, secure=True)['X-Profile-Id'])
+            for _ in range(3)
+        ]
+        self.assertEqual(sorted(RequestProfile.objects.values_list('pk', flat=True)), ids[1:])
+        self.assertEqual(len(os.listdir(self.profile_dir)), 6)
+
+
+# ---------------------------
+# Load-Test Harness
+# ---------------------------
+class LoadTestHarnessTests(TestCase):
+    def setUp(self):
+        tokens.clear()
+        self.stub, self.stub_url = start_etsy_stub()
+        self.addCleanup(self.stub.shutdown)
+        self.port = self.stub.server_address[1]
+
+    def _get(self, path):
+        async def go():
+            conn = HttpConnection('127.0.0.1', self.port)
+            try:
+                # Two requests on one keep-alive connection
+                return [await conn.request('GET', path), await conn.request('GET', path)]
+            finally:
+                await conn.close()
+        return asyncio.run(go())
+
+    def test_client_against_stub(self):
+        self.assertEqual(self._get('/application/shops/1/listings'), [200, 200])
+        self.assertEqual(self._get('/missing'), [404, 404])
+
+    def test_stub_error_rate_counts_as_errors(self):
+        self.stub.error_rate = 1.0
+        statuses = self._get('/application/shops/1/listings')
+        self.assertEqual(statuses, [503, 503])
+
+        summary = summarize([('read', status, 0.01) for status in statuses] + [('write', 202, 0.02)], 1.0)
+        self.assertEqual(summary['all']['requests'], 3)
+        self.assertEqual(summary['read']['error_rate'], 1.0)
+        self.assertEqual(summary['write']['error_rate'], 0.0)
+
+    def test_etsy_job_follows_api_base(self):
+        user = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        with override_settings(ETSY_API_BASE=self.stub_url):
+            # Inside the refresh margin: refreshed through the stub's token endpoint first
+            tokens.store(user, 'etsy', {'access_token': 'old', 'refresh_token': 'r1', 'expires_in': 60})
+            job = enqueue('etsy_fetch_listings', {'user_id': user.pk}, user=user)
+            run_job(claim_job('test'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(job.result['count'], 25)
+        self.assertTrue(OAuthToken.objects.get(user=user).access_token.startswith('stub-'))
+
+    def test_command_requires_confirmation(self):
+        with self.assertRaisesMessage(CommandError, '--write-to-database'):
+            call_command('loadtest')
+
+    @override_settings(ETSY_WEBHOOK_SECRET='test-secret')
+    def test_cleanup_removes_only_load_data(self):
+        real = Product.objects.create(name='Planner', price=10, cost=2, etsy_listing_id=55)
+        buyer = User.objects.create_user('etsy-9', is_active=False)
+        Order.objects.create(product=real, user=buyer, etsy_transaction_id=1, status='completed')
+        for _ in range(3):
+            body, headers = _webhook_request('test-secret')
+            self.client.post(reverse('etsy_webhook'), body, content_type='application/json',
+                             secure=True, headers=headers)
+        drain_events()
+        user = User.objects.create(username='loadtest', is_superuser=True)
+        user.set_unusable_password()
+        user.save()
+        enqueue('generate_products', {'count': 1}, user=user)
+        self.assertEqual(Order.objects.count(), 4)
+
+        self.assertGreater(cleanup_load_data(), 0)
+        self.assertEqual(list(Order.objects.values_list('etsy_transaction_id', flat=True)), [1])
+        self.assertEqual(list(Product.objects.all()), [real])
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['etsy-9'])
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.assertFalse(Job.objects.exists())
@@ -0,0 +1,210 @@
+"""
+OAuth token manager for Etsy and Canva.
+
+Tokens live in OAuthToken. Valid access tokens are also kept in process
+memory, so most API calls need no DB read. A token is refreshed shortly
+before it expires. Concurrent refreshes are serialized by a per-token
+lock in this process and by a row lock (SELECT ... FOR UPDATE) across
+processes, so only one refresh hits the provider.
+"""
+import datetime
+import threading
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OAuthToken
+
+# Refresh this long before expiry
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+# How long "user has no token" is remembered in memory
+MISSING_TTL = datetime.timedelta(seconds=60)
+
+
+class TokenError(Exception):
+    """No usable token (not connected, or the refresh was rejected)."""
+
+
+def _providers():
+    return {
+        'etsy': {
+            'token_url': f"{settings.ETSY_API_BASE}/public/oauth/token",
+            'client_id': settings.ETSY_CLIENT_ID,
+            'client_secret': settings.ETSY_CLIENT_SECRET,
+            # Etsy v3 wants the keystring on every API call
+            'headers': {'x-api-key': settings.ETSY_CLIENT_ID},
+        },
+        'canva': {
+            'token_url': f"{settings.CANVA_API_BASE}/oauth/token",
+            'client_id': settings.CANVA_CLIENT_ID,
+            'client_secret': settings.CANVA_CLIENT_SECRET,
+            'headers': {},
+        },
+    }
+
+
+def token_url(provider):
+    return _providers()[provider]['token_url']
+
+
+class TokenManager:
+    def __init__(self):
+        self._cache = {}  # (user_id, provider) -> (access_token or None, valid_until)
+        self._cache_lock = threading.Lock()
+        self._refresh_locks = {}
+
+    def _key_lock(self, key):
+        with self._cache_lock:
+            return self._refresh_locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry and entry[1] > timezone.now():
+            return entry
+        return None
+
+    def _remember(self, token):
+        key = (token.user_id, token.provider)
+        if token.expires_at:
+            valid_until = token.expires_at - REFRESH_MARGIN
+        else:
+            # Unknown expiry (legacy token): trust it until a 401
+            valid_until = timezone.now() + datetime.timedelta(days=365)
+        self._cache[key] = (token.access_token, valid_until)
+
+    def invalidate(self, user_id, provider):
+        self._cache.pop((user_id, provider), None)
+
+    def clear(self):
+        self._cache.clear()
+
+    # --------------------------
+    # Public API
+    # --------------------------
+    def store(self, user, provider, token_data):
+        """
+        Save a token response from the provider's token endpoint.
+        """
+        expires_in = token_data.get('expires_in')
+        token, _ = OAuthToken.objects.update_or_create(
+            user=user,
+            provider=provider,
+            defaults={
+                'access_token': token_data['access_token'],
+                'refresh_token': token_data.get('refresh_token') or '',
+                'expires_at': timezone.now() + datetime.timedelta(seconds=int(expires_in)) if expires_in else None,
+                'scope': token_data.get('scope') or '',
+            },
+        )
+        self._remember(token)
+        return token
+
+    def has_token(self, user, provider):
+        """
+        Whether the user has connected the provider. Never refreshes, so
+        views can call it without waiting on the provider; the refresh
+        happens in whichever job makes the API call.
+        """
+        key = (user.pk, provider)
+        entry = self._cache.get(key)
+        if entry and entry[0]:
+            return True
+        if entry and entry[1] > timezone.now():
+            return False
+
+        if OAuthToken.objects.filter(user_id=user.pk, provider=provider).exists():
+            return True
+        self._cache[key] = (None, timezone.now() + MISSING_TTL)
+        return False
+
+    def get_access_token(self, user, provider, force_refresh=False):
+        """
+        A valid access token for the user, refreshing it if it is about
+        to expire. Raises TokenError when the user isn't connected.
+        """
+        key = (user.pk, provider)
+        if not force_refresh:
+            entry = self._cached(key)
+            if entry:
+                if entry[0] is None:
+                    raise TokenError(f"{provider} account not connected")
+                return entry[0]
+
+        with self._key_lock(key):
+            # Another thread may have refreshed while we waited
+            if not force_refresh:
+                entry = self._cached(key)
+                if entry and entry[0]:
+                    return entry[0]
+
+            token = OAuthToken.objects.filter(user_id=user.pk, provider=provider).first()
+            if token is None:
+                self._cache[key] = (None, timezone.now() + MISSING_TTL)
+                raise TokenError(f"{provider} account not connected")
+
+            if force_refresh or token.needs_refresh(REFRESH_MARGIN):
+                token = self._refresh(token, force_refresh)
+            self._remember(token)
+            return token.access_token
+
+    def request(self, user, provider, method, url, session=None, **kwargs):
+        """
+        Make an authenticated API call. A 401 forces one refresh and retry.
+        """
+        http = session or requests
+        headers = {**_providers()[provider]['headers'], **kwargs.pop('headers', {})}
+        kwargs.setdefault('timeout', 30)
+
+        token = self.get_access_token(user, provider)
+        response = http.request(method, url, headers={**headers, 'Authorization': f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            self.invalidate(user.pk, provider)
+            token = self.get_access_token(user, provider, force_refresh=True)
+            response = http.request(method, url, headers={**headers, 'Authorization': f"Bearer {token}"}, **kwargs)
+        return response
+
+    def _refresh(self, token, force):
+        with transaction.atomic():
+            token = OAuthToken.objects.select_for_update().get(pk=token.pk)
+            # Another process refreshed it while we waited on the row lock
+            if not force and not token.needs_refresh(REFRESH_MARGIN):
+                return token
+            if not token.refresh_token:
+                if token.expires_at is None and not force:
+                    return token
+                raise TokenError(f"{token.provider} token expired and cannot be refreshed")
+
+            provider = _providers()[token.provider]
+            try:
+                response = requests.post(
+                    provider['token_url'],
+                    data={
+                        'grant_type': 'refresh_token',
+                        'refresh_token': token.refresh_token,
+                        'client_id': provider['client_id'],
+                    },
+                    auth=(provider['client_id'], provider['client_secret']),
+                    timeout=30,
+                )
+            except requests.RequestException as e:
+                raise TokenError(f"{token.provider} refresh failed: {e}") from e
+            if response.status_code != 200:
+                raise TokenError(f"{token.provider} refresh failed: {response.status_code}")
+
+            try:
+                data = response.json()
+                access_token = data['access_token']
+            except (ValueError, KeyError, TypeError) as e:
+                raise TokenError(f"{token.provider} refresh returned an invalid response") from e
+            token.access_token = access_token
+            # Providers may rotate the refresh token
+            token.refresh_token = data.get('refresh_token') or token.refresh_token
+            if data.get('expires_in'):
+                token.expires_at = timezone.now() + datetime.timedelta(seconds=int(data['expires_in']))
+            token.save(update_fields=['access_token', 'refresh_token', 'expires_at', 'updated_at'])
+            return token
+
+
+tokens = TokenManager()
@@ -10,12 +10,19 @@ urlpatterns = [
     path('orders/', views.orders_list, name='orders'),
     path('revenue/', views.revenue_dashboard, name='revenue'),
     path('generate-products/', views.generate_products, name='generate_products'),
+    path('jobs/', views.jobs_list, name='jobs'),
+    path('jobs/<int:job_id>/', views.job_detail, name='job_detail'),
+    path('jobs/<int:job_id>/status/', views.job_status, name='job_status'),
+    path('ops/db-pool/', views.db_pool_stats, name='db_pool_stats'),
+    path('ops/profiles/<int:profile_id>/<str:kind>/', views.profile_download, name='profile_download'),
 
     
     path('etsy/login/', views.etsy_login, name='etsy_login'),       # Initiates OAuth
     path('etsy/callback/', views.etsy_callback, name='etsy_callback'), # Public endpoint for Etsy
+    path('etsy/webhook/', views.etsy_webhook, name='etsy_webhook'),   # Public endpoint for Etsy events
 
     
     path('canva/callback/', views.canva_callback, name='canva_callback'),
     path('canva/login/', views.canva_login, name='canva_login'),  # Optional: button to start auth
+    path('canva/thumbnails/<str:digest>/', views.canva_thumbnail, name='canva_thumbnail'),
 ]
\ No newline at end of file
@@ -1,16 +1,29 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.models import Sum, F, Count
 from django.contrib.auth.models import User
-from .models import Product, Order
+from .models import Product, Order, ArchivedOrder, OrderRollup, Job, WebhookEvent, RequestProfile
 from django.shortcuts import render, redirect, get_object_or_404
-import random
 from django.utils import timezone
 import datetime
+from collections import Counter
 from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+import json
 import requests
+from .db import pool_stats, statement_timeout
+from .archive import archived_totals
+from .jobs import enqueue
+from .webhooks import verify_signature
+from .canva import ThumbnailCache, image_content_type
+from .tokens import token_url, tokens
+from .search import SORT_CHOICES, search_products
+from .paginators import EstimatedCountPaginator
+from .profiling import profile_file_path
 
 # ---------------------------
 # Login View
@@ -57,6 +70,7 @@ def logout_view(request):
 # Dashboard View
 # ---------------------------
 @login_required
+@statement_timeout()
 def dashboard(request):
     # -----------------------------
     # Summary Metrics
@@ -65,23 +79,24 @@ def dashboard(request):
     active_products = Product.objects.filter(status='active').count()
     inactive_products = Product.objects.filter(status='inactive').count()
 
-    total_orders = Order.objects.filter(status='completed').count()
-    total_units_sold = Order.objects.filter(status='completed').aggregate(total=Sum('quantity'))['total'] or 0
-    total_revenue = Order.objects.filter(status='completed').aggregate(total=Sum('total_price'))['total'] or 0
+    # Archived orders only contribute through their rollup totals
+    archived = archived_totals(status='completed')
+    total_orders = Order.objects.filter(status='completed').count() + archived['count']
+    total_units_sold = (Order.objects.filter(status='completed').aggregate(total=Sum('quantity'))['total'] or 0) + archived['units']
+    total_revenue = (Order.objects.filter(status='completed').aggregate(total=Sum('total_price'))['total'] or 0) + archived['revenue']
 
     # Total cost = sum of product costs (one-time cost per product)
     total_cost = Product.objects.aggregate(total=Sum('cost'))['total'] or 0
     total_profit = total_revenue - total_cost
 
     # Most Selling Product
-    most_selling_product = Product.objects.annotate(units_sold=Sum('orders__quantity')) \
-                                          .filter(orders__status='completed') \
-                                          .order_by('-units_sold').first()
+    most_selling_product = Product.objects.filter(units_sold__gt=0).order_by('-units_sold', '-pk').first()
 
     # Most Profitable Product
-    most_profitable_product = Product.objects.annotate(total_profit=(F('price') - F('cost')) * Sum('orders__quantity')) \
-                                             .filter(orders__status='completed') \
-                                             .order_by('-total_profit').first()
+    # units_sold includes archived orders, so no join on Order is needed
+    most_profitable_product = Product.objects.annotate(total_profit=(F('price') - F('cost')) * F('units_sold')) \
+                                             .filter(units_sold__gt=0) \
+                                             .order_by('-total_profit', '-pk').first()
 
     # Products Generated Today
     today = timezone.now().date()
@@ -98,21 +113,8 @@ def dashboard(request):
     # Etsy Integration (Optional)
     # -----------------------------
     etsy_data = None
-    profile = getattr(request.user, 'profile', None)
-    access_token = getattr(profile, 'etsy_access_token', None)
-
-    if access_token:
-        try:
-            # Example: Fetch shop listings
-            shop_id = "YOUR_SHOP_ID"  # Replace with actual shop ID
-            headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(f"https://openapi.etsy.com/v3/application/shops/{shop_id}/listings", headers=headers)
-            if response.status_code == 200:
-                etsy_data = response.json()
-            else:
-                etsy_data = {'error': f"Failed to fetch Etsy data: {response.status_code}"}
-        except Exception as e:
-            etsy_data = {'error': str(e)}
+    if tokens.has_token(request.user, 'etsy'):
+        etsy_data = _etsy_listings(request.user)
 
     # -----------------------------
     # Context for Template
@@ -143,22 +145,100 @@ def dashboard(request):
     return render(request, 'dashboard.html', context)
 
 
+def _etsy_listings(user):
+    """
+    Latest Etsy listings fetched by a background job. Returns the cached
+    result while it is fresh, otherwise queues a refresh and returns
+    {'pending': True, 'job_id': ...} so the page never waits on Etsy.
+    """
+    latest = Job.objects.filter(name='etsy_fetch_listings', user=user).order_by('-created_at').first()
+    if latest and not latest.is_finished:
+        return {'pending': True, 'job_id': latest.pk}
+
+    fresh_after = timezone.now() - datetime.timedelta(seconds=settings.ETSY_LISTINGS_MAX_AGE_SECONDS)
+    if latest and latest.finished_at >= fresh_after:
+        if latest.status == 'succeeded':
+            return latest.result
+        return {'error': 'Failed to fetch Etsy data'}
+
+    job = enqueue('etsy_fetch_listings', {'user_id': user.pk}, user=user)
+    return {'pending': True, 'job_id': job.pk}
+
+
 # ---------------------------
 # Products List (Read-Only)
 # ---------------------------
 @login_required
 def products_list(request):
     """
-    Display all products in read-only mode.
+    Display products in read-only mode, with name search, status/price/cost
+    filters and sorting (see home.search), 50 per page.
     """
-    products = Product.objects.order_by('-created_at')
-    return render(request, 'products.html', {'products': products})
+    paginator = EstimatedCountPaginator(search_products(request.GET), 50)
+    page = paginator.get_page(request.GET.get('page'))
+    products = list(page.object_list)
+    _attach_canva_thumbnails(request.user, products)
+
+    # Current filters without the page number, for pagination links
+    params = request.GET.copy()
+    params.pop('page', None)
+
+    return render(request, 'products.html', {
+        'products': products,
+        'page': page,
+        'filters': request.GET,
+        'querystring': params.urlencode(),
+        'status_choices': Product.STATUS_CHOICES,
+        'sort_choices': SORT_CHOICES,
+    })
+
+
+def _attach_canva_thumbnails(user, products):
+    """
+    Set product.canva_thumbnail to the cached thumbnail digest. Designs
+    missing from the cache are fetched by a background job, so the page
+    never waits on Canva.
+    """
+    cache = ThumbnailCache()
+    missing = []
+    for product in products:
+        product.canva_thumbnail = None
+        if product.canva_design_id:
+            product.canva_thumbnail = cache.digest_for(product.canva_design_id)
+            if product.canva_thumbnail is None:
+                missing.append(product.canva_design_id)
+
+    if not missing or not tokens.has_token(user, 'canva'):
+        return
+    already_queued = Job.objects.filter(
+        name='canva_fetch_thumbnails', user=user, status__in=['queued', 'running'],
+    ).exists()
+    if not already_queued:
+        enqueue('canva_fetch_thumbnails', {'user_id': user.pk, 'design_ids': missing}, user=user)
+
+
+@login_required
+def canva_thumbnail(request, digest):
+    """
+    Serve a cached Canva thumbnail. URLs are content-addressed, so the
+    response can be cached forever.
+    """
+    cache = ThumbnailCache()
+    try:
+        f = cache.open(digest)
+    except (ValueError, FileNotFoundError):
+        raise Http404('Thumbnail not cached')
+    response = FileResponse(f, content_type=image_content_type(f))
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response['ETag'] = f'"{digest}"'
+    return response
 
 
 # ---------------------------
 # Orders List (Read-Only)
 # ---------------------------
 @login_required
+@statement_timeout()
 def orders_list(request):
     """
     Display all orders in read-only mode with extended details and summary metrics.
@@ -167,19 +247,24 @@ def orders_list(request):
     orders = Order.objects.select_related('product', 'user').order_by('-created_at')
 
     # Summary metrics
-    total_orders = orders.count()
-    completed_orders = orders.filter(status='completed').count()
+    # Summary metrics (archived orders are added from their rollups)
+    archived = archived_totals()
+    total_orders = orders.count() + archived['count']
+    completed_orders = orders.filter(status='completed').count() + archived_totals(status='completed')['count']
     pending_orders = orders.filter(status='pending').count()
-    total_revenue = orders.aggregate(total=Sum('total_price'))['total'] or 0
+    total_revenue = (orders.aggregate(total=Sum('total_price'))['total'] or 0) + archived['revenue']
 
     # Total profit = recurring profit: total revenue minus sum of one-time product costs (per order)
     total_profit = sum(o.total_price - o.product.cost for o in orders)
+    total_profit += sum(r.revenue - r.product.cost * r.order_count for r in OrderRollup.objects.select_related('product'))
 
     # Product-wise summary for optional table
-    products = Product.objects.all()
+    products = Product.objects.prefetch_related('order_rollups')
     product_summary = []
     for p in products:
         units_sold = orders.filter(product=p, status='completed').aggregate(total=Sum('quantity'))['total'] or 0
+        archived_product = p.archived_completed
+        units_sold += archived_product.units if archived_product else 0
         total_revenue_product = units_sold * p.price
         total_profit_product = total_revenue_product - p.cost  # recurring profit
         product_summary.append({
@@ -206,20 +291,27 @@ def orders_list(request):
 
 
 @login_required
+@statement_timeout()
 def revenue_dashboard(request):
     """
     Revenue dashboard with detailed metrics:
     - One-time product cost
     - Recurring profit
     - Sales, profitability, popularity, customer metrics
+
+    Totals always include archived orders via their rollups. Pass
+    ?include_archived=1 to also read archived rows for customer metrics.
     """
+    include_archived = request.GET.get('include_archived') == '1'
+
     # -----------------------------
     # Global Metrics
     # -----------------------------
     completed_orders = Order.objects.filter(status='completed')
-    total_orders = completed_orders.aggregate(total=Count('id'))['total'] or 0
-    total_units = completed_orders.aggregate(total=Sum('quantity'))['total'] or 0
-    total_revenue = completed_orders.aggregate(total=Sum('total_price'))['total'] or 0
+    archived = archived_totals(status='completed')
+    total_orders = (completed_orders.aggregate(total=Count('id'))['total'] or 0) + archived['count']
+    total_units = (completed_orders.aggregate(total=Sum('quantity'))['total'] or 0) + archived['units']
+    total_revenue = (completed_orders.aggregate(total=Sum('total_price'))['total'] or 0) + archived['revenue']
 
     # Total cost = sum of all product one-time costs
     total_cost = Product.objects.aggregate(total=Sum('cost'))['total'] or 0
@@ -232,7 +324,7 @@ def revenue_dashboard(request):
     # -----------------------------
     # Product Metrics
     # -----------------------------
-    products = Product.objects.all()
+    products = Product.objects.prefetch_related('order_rollups')
     product_data = []
     for p in products:
         units_sold = p.total_quantity_sold
@@ -267,14 +359,24 @@ def revenue_dashboard(request):
     # -----------------------------
     # Customer Metrics
     # -----------------------------
-    users_with_orders = User.objects.filter(order__status='completed').distinct()
-    active_customers = users_with_orders.count()
-    repeat_customers = sum(1 for u in users_with_orders if u.order_set.filter(status='completed').count() > 1)
-    avg_orders_per_customer = (total_orders / active_customers) if active_customers > 0 else 0
+    # Completed orders per customer, grouped in the database. By default
+    # only hot orders are read, so the average uses hot orders too.
+    orders_per_customer = Counter(dict(
+        completed_orders.values_list('user_id').annotate(n=Count('id')).order_by()
+    ))
+    if include_archived:
+        orders_per_customer.update(dict(
+            ArchivedOrder.objects.filter(status='completed')
+            .values_list('user_id').annotate(n=Count('id')).order_by()
+        ))
+    active_customers = len(orders_per_customer)
+    repeat_customers = sum(1 for n in orders_per_customer.values() if n > 1)
+    customer_orders = sum(orders_per_customer.values())
+    avg_orders_per_customer = (customer_orders / active_customers) if active_customers > 0 else 0
 
     pending_orders = Order.objects.filter(status='pending').count()
     completed_orders_count = total_orders
-    canceled_orders = Order.objects.filter(status='canceled').count()
+    canceled_orders = Order.objects.filter(status='canceled').count() + archived_totals(status='canceled')['count']
 
     # -----------------------------
     # Operational Metrics
@@ -310,18 +412,47 @@ def revenue_dashboard(request):
         'cost_efficiency': round(cost_efficiency, 2),
         'avg_production_time': avg_production_time,
         'forecasted_revenue': forecasted_revenue,
+        'include_archived': include_archived,
     }
 
     return render(request, 'revenue.html', context)
 
 
+# ---------------------------
+# DB Pool Stats (Superusers)
+# ---------------------------
+@user_passes_test(lambda u: u.is_superuser)
+def db_pool_stats(request):
+    """
+    Pool counters for the worker process that served this request.
+    """
+    stats = pool_stats()
+    return JsonResponse({'pooling': stats is not None, 'stats': stats or {}})
+
+
+# ---------------------------
+# Request Profile Files (Superusers)
+# ---------------------------
+@user_passes_test(lambda u: u.is_superuser)
+def profile_download(request, profile_id, kind):
+    """
+    Download a stored profile file (pstats, collapsed or sql).
+    """
+    profile = get_object_or_404(RequestProfile, pk=profile_id)
+    try:
+        f = open(profile_file_path(profile, kind), 'rb')
+    except (KeyError, FileNotFoundError):
+        raise Http404('Profile file not found')
+    suffix = {'pstats': 'pstats', 'collapsed': 'collapsed', 'sql': 'sql.json'}[kind]
+    return FileResponse(f, as_attachment=True, filename=f"{profile.file_prefix}.{suffix}")
+
+
 @login_required
 def generate_products(request):
     """
-    Generate multiple digital products at once with randomized prices and costs.
+    Queue generation of multiple digital products with randomized prices
+    and costs; the work runs in a background job (see home.tasks).
     """
-    generated_products = []
-
     if request.method == 'POST':
         count = int(request.POST.get('count', 0))
         base_name = request.POST.get('base_name', 'Product')
@@ -331,17 +462,56 @@ def generate_products(request):
             messages.error(request, 'Please enter a valid number of products.')
             return redirect('generate_products')
 
-        for i in range(1, count + 1):
-            name = f"{base_name} #{i}"
-            price = round(random.uniform(5, 50), 2)  # Price between $5 and $50
-            cost = round(random.uniform(1, price - 1), 2)  # Cost less than price
-            product = Product(name=name, price=price, cost=cost, status=status)
-            product.save()
-            generated_products.append(product)
+        job = enqueue('generate_products', {
+            'count': count,
+            'base_name': base_name,
+            'status': status,
+        }, user=request.user)
+        messages.success(request, f'Generation of {count} products has been queued.')
+        return redirect('job_detail', job_id=job.pk)
+
+    return render(request, 'generate_products.html')
+
+
+# ---------------------------
+# Background Jobs
+# ---------------------------
+def _visible_jobs(user):
+    jobs = Job.objects.all()
+    return jobs if user.is_staff else jobs.filter(user=user)
+
+
+@login_required
+def jobs_list(request):
+    """
+    Recent background jobs (all jobs for staff, own jobs otherwise).
+    """
+    jobs = _visible_jobs(request.user).select_related('user').order_by('-created_at')[:50]
+    return render(request, 'jobs.html', {'jobs': jobs})
+
 
-        messages.success(request, f'{count} products generated successfully!')
+@login_required
+def job_detail(request, job_id):
+    job = get_object_or_404(_visible_jobs(request.user), pk=job_id)
+    return render(request, 'job_detail.html', {'job': job})
 
-    return render(request, 'generate_products.html', {'generated_products': generated_products})
+
+@login_required
+def job_status(request, job_id):
+    """
+    JSON polling endpoint used by job_detail.html.
+    """
+    job = get_object_or_404(_visible_jobs(request.user), pk=job_id)
+    return JsonResponse({
+        'id': job.pk,
+        'name': job.name,
+        'status': job.status,
+        'finished': job.is_finished,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        'error': job.last_error.strip().splitlines()[-1] if job.last_error else None,
+    })
 
 
 # Step 1: Redirect user to Etsy OAuth
@@ -372,18 +542,51 @@ def etsy_callback(request):
         "code": code,
         "redirect_uri": settings.ETSY_REDIRECT_URI
     }
-    response = requests.post("https://api.etsy.com/v3/public/oauth/token", data=data)
+    response = requests.post(token_url('etsy'), data=data, timeout=30)
     token_data = response.json()
 
-    # Save access token to database for the logged-in user
-    if request.user.is_authenticated:
-        request.user.profile.etsy_access_token = token_data.get("access_token")
-        request.user.profile.save()
+    # Save access/refresh tokens for the logged-in user
+    if request.user.is_authenticated and token_data.get("access_token"):
+        tokens.store(request.user, 'etsy', token_data)
 
     # Redirect to private dashboard
     return redirect('/dashboard/?etsy_connected=1')
 
 
+# Public webhook endpoint for Etsy events
+@csrf_exempt
+@require_POST
+def etsy_webhook(request):
+    """
+    Verify the signature and append the raw event to the ingestion log.
+    Events are applied to orders/products later by drain_webhooks, so
+    this stays a single INSERT per delivery.
+    """
+    body = request.body
+    event_id = request.headers.get('webhook-id')
+    if not verify_signature(
+        event_id,
+        request.headers.get('webhook-timestamp'),
+        body,
+        request.headers.get('webhook-signature'),
+    ):
+        return HttpResponse(status=401)
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return HttpResponse(status=400)
+    if not isinstance(payload, dict):
+        return HttpResponse(status=400)
+
+    WebhookEvent.objects.create(
+        event_id=event_id[:100],
+        event_type=str(payload.get('event_type', ''))[:100],
+        payload=payload,
+    )
+    return HttpResponse(status=202)
+
+
 
 
 
@@ -419,7 +622,7 @@ def canva_callback(request):
     }
 
     try:
-        response = requests.post("https://api.canva.com/v1/oauth/token", data=data)
+        response = requests.post(token_url('canva'), data=data, timeout=30)
         token_data = response.json()
     except Exception as e:
         return render(request, 'canva_callback.html', {
@@ -434,10 +637,8 @@ def canva_callback(request):
             'message': token_data.get("error_description", "Unknown error occurred.")
         })
 
-    # Save token to user profile
-    profile = getattr(request.user, 'profile', None)
-    if profile:
-        profile.canva_access_token = access_token
-        profile.save()
+    # Save access/refresh tokens for the logged-in user
+    if request.user.is_authenticated:
+        tokens.store(request.user, 'canva', token_data)
 
     return render(request, 'canva_callback.html', {'success': True})
\ No newline at end of file
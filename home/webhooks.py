@@ -0,0 +1,320 @@
+"""
+Etsy webhook ingestion.
+
+The webhook view only verifies the signature and appends a WebhookEvent
+row. drain_events() later applies the log in batches: duplicates are
+dropped by event id, and products and orders are upserted with
+bulk_create.
+
+Events are expected in the shape recorded from our Etsy integration:
+
+    {"event_type": "listing.updated",
+     "data": {"listing_id": 1, "title": "...", "price": "9.99", "state": "active"}}
+
+    {"event_type": "order.paid",
+     "data": {"transaction_id": 7, "listing_id": 1, "quantity": 2, "price": "9.99",
+              "buyer_user_id": 42, "buyer_email": "buyer@example.com"}}
+"""
+import base64
+import hashlib
+import hmac
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order, Product, WebhookEvent
+
+# Seconds a delivery timestamp may differ from now (replay protection)
+SIGNATURE_TOLERANCE = 300
+
+LISTING_EVENTS = {'listing.created', 'listing.updated'}
+ORDER_STATUS_BY_EVENT = {
+    'order.created': 'pending',
+    'order.paid': 'completed',
+    'order.canceled': 'canceled',
+}
+# Delivery order isn't guaranteed: a late order.created must not turn a
+# paid or canceled order back into pending
+STATUS_RANK = {'pending': 0, 'completed': 1, 'canceled': 1}
+
+BIGINT_RANGE = range(-2 ** 63, 2 ** 63)
+MAX_QUANTITY = 2 ** 31 - 1  # PositiveIntegerField
+
+
+# --------------------------
+# Signatures
+# --------------------------
+def _secret_bytes(secret):
+    if secret.startswith('whsec_'):
+        return base64.b64decode(secret[len('whsec_'):])
+    return secret.encode()
+
+
+def sign_payload(event_id, timestamp, body, secret=None):
+    """
+    Signature for a delivery, in the "v1,<base64 HMAC-SHA256>" format
+    of the webhook-signature header. `body` is the raw request bytes.
+    """
+    secret = secret or settings.ETSY_WEBHOOK_SECRET
+    message = f"{event_id}.{timestamp}.".encode() + body
+    digest = hmac.new(_secret_bytes(secret), message, hashlib.sha256).digest()
+    return f"v1,{base64.b64encode(digest).decode()}"
+
+
+def verify_signature(event_id, timestamp, body, signature_header, secret=None):
+    """
+    True if any signature in the header matches and the timestamp is
+    recent. Always False when no webhook secret is configured.
+    """
+    secret = secret or settings.ETSY_WEBHOOK_SECRET
+    if not (secret and event_id and timestamp and signature_header):
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > SIGNATURE_TOLERANCE:
+            return False
+    except ValueError:
+        return False
+
+    expected = sign_payload(event_id, timestamp, body, secret)
+    return any(hmac.compare_digest(expected, candidate) for candidate in signature_header.split())
+
+
+# --------------------------
+# Consumer
+# --------------------------
+def drain_batch(batch_size=500):
+    """
+    Apply one batch of unprocessed events. Returns the number of events
+    consumed (including duplicates and ignored ones).
+    """
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.filter(processed_at__isnull=True)
+            .select_for_update(skip_locked=True)
+            .order_by('pk')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        already_seen = set(
+            WebhookEvent.objects.filter(
+                event_id__in={e.event_id for e in events}, processed_at__isnull=False,
+            ).values_list('event_id', flat=True)
+        )
+
+        parsed = []  # (event, 'listing' or 'order', parsed data)
+        for event in events:
+            if event.event_id in already_seen:
+                event.error = 'duplicate'
+                continue
+            already_seen.add(event.event_id)
+            data = event.payload.get('data') or {}
+            try:
+                if event.event_type in LISTING_EVENTS:
+                    parsed.append((event, 'listing', _parse_listing(data)))
+                elif event.event_type in ORDER_STATUS_BY_EVENT:
+                    parsed.append((event, 'order', _parse_order(data, ORDER_STATUS_BY_EVENT[event.event_type])))
+            except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+                event.error = f"invalid payload: {e!r}"
+
+        try:
+            with transaction.atomic():
+                _apply([(kind, item) for _, kind, item in parsed])
+        except DatabaseError:
+            # Something the parsers didn't catch: retry event by event so
+            # one bad delivery is marked instead of blocking the log forever
+            for event, kind, item in parsed:
+                try:
+                    with transaction.atomic():
+                        _apply([(kind, item)])
+                except DatabaseError as e:
+                    event.error = f"database error: {e}"
+
+        now = timezone.now()
+        for event in events:
+            event.processed_at = now
+        WebhookEvent.objects.bulk_update(events, ['processed_at', 'error'])
+
+    return len(events)
+
+
+def drain_events(batch_size=500, max_batches=None):
+    """
+    Drain the ingestion log until empty (or max_batches). Returns the
+    total number of events consumed.
+    """
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        consumed = drain_batch(batch_size)
+        if not consumed:
+            break
+        total += consumed
+        batches += 1
+    return total
+
+
+def _apply(items):
+    """
+    Upsert parsed (kind, data) items, in event order. Later events for
+    the same listing/transaction win, except that an order never moves
+    back to a lower-ranked status.
+    """
+    by_listing = {item['listing_id']: item for kind, item in items if kind == 'listing'}
+    by_transaction = {}
+    for order in (item for kind, item in items if kind == 'order'):
+        previous = by_transaction.get(order['transaction_id'])
+        if previous and STATUS_RANK[previous['status']] > STATUS_RANK[order['status']]:
+            order['status'] = previous['status']
+        by_transaction[order['transaction_id']] = order
+    _upsert_listings(by_listing)
+    _upsert_orders(by_transaction)
+
+
+# Values are checked against the columns here, so a bad payload is marked
+# "invalid payload" instead of failing the whole batch in the database.
+def _bigint(value, name):
+    number = int(value)
+    if number not in BIGINT_RANGE:
+        raise ValueError(f"{name} out of range: {value!r}")
+    return number
+
+
+def _money(value, field):
+    """Non-negative amount that fits `field` (a DecimalField)."""
+    amount = Decimal(str(value)).quantize(Decimal(1).scaleb(-field.decimal_places))
+    if amount < 0 or amount >= 10 ** (field.max_digits - field.decimal_places):
+        raise ValueError(f"{field.name} out of range: {value!r}")
+    return amount
+
+
+def _parse_listing(data):
+    listing_id = _bigint(data['listing_id'], 'listing_id')
+    name = str(data.get('title') or f"Etsy listing {listing_id}")
+    return {
+        'listing_id': listing_id,
+        'name': name[:Product._meta.get_field('name').max_length],
+        'price': _money(data.get('price', 0), Product._meta.get_field('price')),
+        'status': 'active' if data.get('state', 'active') == 'active' else 'inactive',
+    }
+
+
+def _parse_order(data, status):
+    quantity = int(data.get('quantity', 1))
+    if not 1 <= quantity <= MAX_QUANTITY:
+        raise ValueError(f"quantity out of range: {quantity!r}")
+    price = _money(data.get('price', 0), Product._meta.get_field('price'))
+    # Also checks price * quantity fits Order.total_price
+    _money(price * quantity, Order._meta.get_field('total_price'))
+    email = str(data.get('buyer_email') or '')
+    return {
+        'transaction_id': _bigint(data['transaction_id'], 'transaction_id'),
+        'listing_id': _bigint(data['listing_id'], 'listing_id'),
+        'quantity': quantity,
+        'price': price,
+        'buyer': str(_bigint(data['buyer_user_id'], 'buyer_user_id')),
+        'buyer_email': email if len(email) <= User._meta.get_field('email').max_length else '',
+        'status': status,
+    }
+
+
+def _upsert_listings(listings):
+    if not listings:
+        return
+    Product.objects.bulk_create(
+        [
+            Product(etsy_listing_id=listing_id, name=l['name'], price=l['price'], status=l['status'])
+            for listing_id, l in listings.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['etsy_listing_id'],
+        update_fields=['name', 'price', 'status'],
+    )
+
+
+def _upsert_orders(orders):
+    # Transactions that were already archived stay archived
+    archived = set(
+        ArchivedOrder.objects.filter(etsy_transaction_id__in=orders.keys())
+        .values_list('etsy_transaction_id', flat=True)
+    )
+    orders = {tid: v for tid, v in orders.items() if tid not in archived}
+    if not orders:
+        return
+
+    # Orders can arrive before their listing event: add placeholders
+    prices = {o['listing_id']: o['price'] for o in orders.values()}
+    Product.objects.bulk_create(
+        [
+            Product(etsy_listing_id=listing_id, name=f"Etsy listing {listing_id}", price=price)
+            for listing_id, price in prices.items()
+        ],
+        ignore_conflicts=True,
+    )
+    products = dict(
+        Product.objects.filter(etsy_listing_id__in=prices).values_list('etsy_listing_id', 'pk')
+    )
+    users = _buyers({o['buyer']: o['buyer_email'] for o in orders.values()})
+
+    # Lock the products, then the existing rows, so a concurrent drain of the
+    # same transactions waits for us and reads what we wrote: statuses can't
+    # regress and the units_sold deltas below don't double count
+    Product.lock(products.values())
+    current = {
+        transaction_id: (product_id, status, quantity)
+        for transaction_id, product_id, status, quantity in
+        Order.objects.select_for_update().filter(etsy_transaction_id__in=orders.keys())
+        .values_list('etsy_transaction_id', 'product_id', 'status', 'quantity')
+    }
+    for transaction_id, o in orders.items():
+        if transaction_id in current:
+            status = current[transaction_id][1]
+            if STATUS_RANK[status] > STATUS_RANK[o['status']]:
+                o['status'] = status
+
+    Order.objects.bulk_create(
+        [
+            Order(
+                etsy_transaction_id=transaction_id,
+                product_id=products[o['listing_id']],
+                user_id=users[o['buyer']],
+                quantity=o['quantity'],
+                # bulk_create skips Order.save(), so price it here
+                total_price=o['price'] * o['quantity'],
+                status=o['status'],
+            )
+            for transaction_id, o in orders.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['etsy_transaction_id'],
+        update_fields=['quantity', 'total_price', 'status'],
+    )
+
+    deltas = defaultdict(int)
+    for transaction_id, o in orders.items():
+        if transaction_id in current:
+            # An existing order keeps its product
+            product_id, status, quantity = current[transaction_id]
+            deltas[product_id] -= Order.sold_units(status, quantity)
+        else:
+            product_id = products[o['listing_id']]
+        deltas[product_id] += Order.sold_units(o['status'], o['quantity'])
+    Product.add_units_sold(deltas)
+
+
+def _buyers(emails_by_buyer):
+    """
+    Map Etsy buyer ids to User pks, creating inactive users for new buyers.
+    """
+    usernames = {f"etsy-{buyer_id}": email for buyer_id, email in emails_by_buyer.items()}
+    User.objects.bulk_create(
+        [User(username=username, email=email, is_active=False) for username, email in usernames.items()],
+        ignore_conflicts=True,
+    )
+    found = User.objects.filter(username__in=usernames).values_list('username', 'pk')
+    return {username[len('etsy-'):]: pk for username, pk in found}